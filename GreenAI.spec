@@ -1,11 +1,17 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+import glob
+
+# Optional YuNet model for GFOCUS_DETECTOR=yunet (Src/detectors.py), bundled when present.
+# Relative datas sources resolve against the spec's directory (SPECPATH), like cascades/*.xml
+models = [('models/*.onnx', 'models')] if glob.glob(os.path.join(SPECPATH, 'models', '*.onnx')) else []
 
 
 a = Analysis(
     ['Src/main.py'],
     pathex=[],
     binaries=[],
-    datas=[('Brain/crystal_brain.pb', 'Brain'), ('cascades/*.xml', 'cascades')],
+    datas=[('Brain/crystal_brain.pb', 'Brain'), ('cascades/*.xml', 'cascades')] + models,
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,154 @@
+""" Versioned binary brain file (replaces the pickled crystal_brain.pb).
+
+    Layout, little-endian:
+      header   MAGIC(8) | version u32 | section count u32 | 48 reserved bytes   (64 bytes)
+      table    per section: name 16s | dtype 8s | ndim u32 | pad u32 | shape 2*u64 | offset u64 | nbytes u64
+      data     raw C-order arrays, each aligned to 64 bytes
+
+    Strings (tokens, domain names) are stored as a string table: one uint8 array with the
+    UTF-8 bytes of all strings and one uint64 offsets array. Loading maps every array with
+    np.memmap (copy-on-write), so it costs the same for a tiny and a huge brain; the first
+    save copies them into memory (see unmap).
+
+    Convert an old pickle brain (only do this for files you trust):
+        python brain_format.py convert Brain/crystal_brain.pb [out.pb]
+"""
+import os
+import sys
+import struct
+import pickle
+import numpy as np # type: ignore
+
+MAGIC = b"CRYSTAL\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sII48x")
+SECTION = struct.Struct("<16s8sII2QQQ")
+ALIGN = 64
+
+class StringTable:
+    """ Read-only list of strings backed by (offsets, utf-8 bytes) arrays; new strings
+        are appended to an in-memory tail. Decodes one entry at a time. """
+    def __init__(self, offsets=None, data=None):
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.uint64)
+        self.data = data if data is not None else np.zeros(0, dtype=np.uint8)
+        self.base = len(self.offsets) - 1
+        self.tail = []
+
+    def __len__(self):
+        return self.base + len(self.tail)
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if i >= self.base: return self.tail[i - self.base]
+        return bytes(self.data[int(self.offsets[i]):int(self.offsets[i + 1])]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)): yield self[i]
+
+    def append(self, s):
+        self.tail.append(s)
+
+def encode_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def write_sections(path, sections):
+    """ Writes {name: array} to path atomically (temp file + rename) """
+    arrays = [(name, np.ascontiguousarray(a)) for name, a in sections.items()]
+    offset = _aligned(HEADER.size + SECTION.size * len(arrays))
+    table = []
+    for name, a in arrays:
+        if a.ndim > 2: raise ValueError(f"section {name}: at most 2 dimensions")
+        shape = list(a.shape) + [0] * (2 - a.ndim)
+        table.append(SECTION.pack(name.encode(), a.dtype.str.encode(), a.ndim, 0, *shape, offset, a.nbytes))
+        offset = _aligned(offset + a.nbytes)
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(arrays)))
+        f.write(b"".join(table))
+        for (name, a), entry in zip(arrays, table):
+            f.seek(SECTION.unpack(entry)[6])
+            f.write(a.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_sections(path):
+    """ Maps every section of a brain file; returns {name: np.memmap} """
+    with open(path, "rb") as f:
+        magic, version, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a crystal brain file (old pickle? run: python brain_format.py convert {path})")
+        if version > VERSION:
+            raise ValueError(f"{path} uses brain format v{version}; this build reads up to v{VERSION}")
+        table = [SECTION.unpack(f.read(SECTION.size)) for _ in range(count)]
+    sections = {}
+    for name, dtype, ndim, _, rows, cols, offset, nbytes in table:
+        name = name.rstrip(b"\x00").decode()
+        shape = (rows, cols)[:ndim]
+        if nbytes == 0:
+            sections[name] = np.zeros(shape, dtype=np.dtype(dtype.rstrip(b"\x00").decode()))
+        else:
+            sections[name] = np.memmap(path, dtype=np.dtype(dtype.rstrip(b"\x00").decode()), mode="c", offset=offset, shape=shape)
+    return sections
+
+def _unmap(obj, *names):
+    for name in names:
+        a = getattr(obj, name)
+        if isinstance(a, np.memmap): setattr(obj, name, np.array(a))
+
+def unmap(vertices, edges):
+    """ Copies the arrays a loaded brain still maps from its file into memory. Windows will
+        not replace a file that has open mappings, so this runs before every save. """
+    _unmap(vertices, "coords")
+    _unmap(edges, "src", "dst", "weights")
+    if isinstance(vertices.tokens, StringTable): _unmap(vertices.tokens, "offsets", "data")
+
+def save_brain(path, vertices, edges, domain_vectors):
+    unmap(vertices, edges)
+    token_offsets, token_bytes = encode_strings(vertices.tokens)
+    names = list(domain_vectors)
+    domain_offsets, domain_bytes = encode_strings(names)
+    src, dst = edges.pairs
+    write_sections(path, {
+        "vertices": vertices.matrix, "token_offsets": token_offsets, "token_bytes": token_bytes,
+        "edge_src": src, "edge_dst": dst, "edge_weight": edges.weights[:edges.n],
+        "domain_offsets": domain_offsets, "domain_bytes": domain_bytes,
+        "domain_vectors": np.array([domain_vectors[n] for n in names], dtype=np.float64).reshape(-1, 3),
+    })
+
+def load_brain(path):
+    """ Returns (vertices, edges, domain_vectors) backed by the mapped file """
+    from crystal_graph import VertexStore, EdgeStore
+    s = read_sections(path)
+    vertices = VertexStore.from_arrays(StringTable(s["token_offsets"], s["token_bytes"]), s["vertices"])
+    edges = EdgeStore.from_arrays(vertices, s["edge_src"], s["edge_dst"], s["edge_weight"])
+    names = StringTable(s["domain_offsets"], s["domain_bytes"])
+    domain_vectors = {names[i]: np.array(s["domain_vectors"][i]) for i in range(len(names))}
+    return vertices, edges, domain_vectors
+
+def convert_pickle(src, dst=None):
+    """ Rewrites a legacy pickled {"vertices", "edges"} brain in this format (dst defaults to src) """
+    from crystal_graph import VertexStore, EdgeStore
+    with open(src, "rb") as f:
+        legacy = pickle.load(f)
+    vertices = VertexStore()
+    for token, coord in legacy.get("vertices", {}).items():
+        vertices[token] = coord
+    edges = EdgeStore(vertices)
+    for key, weight in legacy.get("edges", {}).items():
+        edges[key] = weight
+    save_brain(dst or src, vertices, edges, legacy.get("domain_vectors", {}))
+    return len(vertices), len(edges)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "convert":
+        sys.exit("usage: python brain_format.py convert <old.pb> [new.pb]")
+    n_v, n_e = convert_pickle(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    print(f"Converted {sys.argv[2]}: {n_v} vertices, {n_e} edges")
@@ -2,9 +2,17 @@ import sys
 import numpy as np # type: ignore
 import os
 import re
-import pickle
+import time
+import multiprocessing
 import cv2 # type: ignore
 from collections import defaultdict
+from crystal_graph import VertexStore, EdgeStore
+import brain_format
+import map_export
+from training_manifest import TrainingManifest
+from detectors import create_detector
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".jfif", ".png", ".bmp", ".webp"}
 
 def resource_path(relative_path):
     """ Finds the path relative to the script location, not the terminal CWD """
@@ -16,21 +24,90 @@ def resource_path(relative_path):
         base_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_path, relative_path)
 
-class CrystalEngine:
+class FaceTracker:
+    """ Adaptive detection schedule for live video.
+        A full-resolution face detection runs only every `interval` frames or when a tracked
+        face is lost; in between, each face is searched for in a padded box around its last
+        position, downscaled so the face is about TRACK_FACE_PX wide, and an empty scene is
+        re-scanned at COARSE_SCALE. The interval grows
+        while the result is stable and shrinks when it changes or when detection is slower
+        than the frame budget. """
+    MIN_INTERVAL = 4
+    MAX_INTERVAL = 30
+    PAD = 0.5               # search box padding, as a fraction of the face size
+    TRACK_FACE_PX = 96      # face width inside the downscaled search box
+    EYE_FACE_PX = 120       # face width for the eye search (upper EYE_BAND of the face)
+    EYE_BAND = 0.6
+    COARSE_SCALE = 0.5      # frame scale for the cheap re-scan while nobody is tracked
+    FRAME_BUDGET = 0.040    # seconds per frame we are willing to spend on detection
+
     def __init__(self):
-        self.vertices = {} 
-        # Fixed paths using absolute location of this script
-        face_path = resource_path("cascades/haarcascade_frontalface_default.xml")
-        eye_path = resource_path("cascades/haarcascade_eye.xml")
-        
-        self.face_cascade = cv2.CascadeClassifier(face_path)
-        self.eye_cascade = cv2.CascadeClassifier(eye_path)
+        self.boxes = []
+        self.interval = self.MIN_INTERVAL
+        self.since_full = self.interval  # a new session starts with a full scan
+        self.last_tags = None
+        self.cost = 0.0     # EMA of seconds per _extract_features call
+        self.stats = {"full": 0, "coarse": 0, "tracked": 0, "lost": 0}
+
+    def reset(self):
+        self.boxes = []
+        self.interval = self.MIN_INTERVAL
+        self.since_full = self.interval
 
-        # Safety Check: Print error if files failed to load
-        if self.face_cascade.empty():
-            print(f"ERROR: Could not load face cascade at: {face_path}")
-        if self.eye_cascade.empty():
-            print(f"ERROR: Could not load eye cascade at: {eye_path}")
+    def due_full(self):
+        return self.since_full >= self.interval
+
+    def coarse(self, image, detector):
+        """ Whole-frame scan at COARSE_SCALE; boxes are returned in full-resolution coordinates """
+        s = self.COARSE_SCALE
+        small = cv2.resize(image, None, fx=s, fy=s, interpolation=cv2.INTER_AREA)
+        return [(int(x / s), int(y / s), int(w / s), int(h / s))
+                for (x, y, w, h) in detector.detect(small, int(80 * s))]
+
+    def search(self, image, detector):
+        """ Looks for every tracked face near its last box; returns new boxes, or None if one was lost """
+        H, W = image.shape[:2]
+        found = []
+        for (x, y, w, h) in self.boxes:
+            px, py = int(w * self.PAD), int(h * self.PAD)
+            x0, y0, x1, y1 = max(0, x - px), max(0, y - py), min(W, x + w + px), min(H, y + h + py)
+            roi = image[y0:y1, x0:x1]
+            scale = min(1.0, self.TRACK_FACE_PX / float(w))
+            small = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else roi
+            min_side = max(24, int(80 * scale))
+            hits = detector.detect(small, min_side)
+            if len(hits) == 0:
+                return None
+            # Keep the hit closest in size to the tracked face
+            bx, by, bw, bh = min(hits, key=lambda b: abs(b[2] / scale - w))
+            found.append((int(x0 + bx / scale), int(y0 + by / scale), int(bw / scale), int(bh / scale)))
+        return found
+
+    def record(self, tags, elapsed):
+        self.cost = elapsed if self.cost == 0 else 0.8 * self.cost + 0.2 * elapsed
+        if "no_human_visible" in tags:
+            # Only the coarse scan runs between full scans here: keep re-acquisition quick
+            self.interval = self.MIN_INTERVAL
+        elif tags == self.last_tags:
+            self.interval = min(self.MAX_INTERVAL, self.interval + 1)
+        else:
+            self.interval = self.MIN_INTERVAL
+        if self.cost > self.FRAME_BUDGET and "no_human_visible" not in tags:
+            # CPU cannot keep up: lean harder on tracking
+            self.interval = min(self.MAX_INTERVAL, self.interval * 2)
+        self.last_tags = tags
+
+class CrystalEngine:
+    def __init__(self, tracking=False, detector=None):
+        # Array-backed graph (crystal_graph.py); both still accept dict-style access
+        self.vertices = VertexStore()
+        self.edges = EdgeStore(self.vertices)
+        self.domain_vectors = {}
+        self.image_extensions = IMAGE_EXTENSIONS
+        # tracking=True: live video mode, see FaceTracker. Off for stills and training.
+        self.tracker = FaceTracker() if tracking else None
+        # Face / eye-state backend (detectors.py): "haar" (default) or "yunet"
+        self.detector = create_detector(detector or os.getenv("GFOCUS_DETECTOR", "haar"), resource_path)
 
     def _extract_features(self, img_input):
         if isinstance(img_input, str):
@@ -41,80 +118,199 @@ class CrystalEngine:
         if img is None or img.size == 0:
             return []
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
         # Ensure classifier is loaded before using it
-        if self.face_cascade.empty():
+        if not self.detector.ready():
             return ["no_human_visible"]
 
-        faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(80, 80))
-        
+        image = self.detector.prepare(img)
+        if self.tracker is not None and not isinstance(img_input, str):
+            return self._extract_tracked(image)
+
+        faces = self.detector.detect(image, 80)
+        return self._tags_for_faces(image, faces)
+
+    def _extract_tracked(self, image):
+        """ Same tags as the full path, with the face search scheduled by FaceTracker """
+        started = time.perf_counter()
+        tracker = self.tracker
+        faces = None
+        if not tracker.due_full():
+            if tracker.boxes:
+                faces = tracker.search(image, self.detector)
+                tracker.stats["tracked" if faces is not None else "lost"] += 1
+            else:
+                faces = tracker.coarse(image, self.detector)
+                tracker.stats["coarse"] += 1
+            if faces is not None:
+                tracker.since_full += 1
+        if faces is None:
+            faces = self.detector.detect(image, 80)
+            tracker.stats["full"] += 1
+            tracker.since_full = 0
+        tracker.boxes = faces
+        tags = self._tags_for_faces(image, faces, tracker)
+        tracker.record(tags, time.perf_counter() - started)
+        return tags
+
+    def _tags_for_faces(self, image, faces, tracker=None):
         tags = ["visual_input"]
         if len(faces) > 0:
             tags.append("face_found")
-            for (x, y, w, h) in faces:
-                roi_gray = gray[y:y+h, x:x+w]
-                eyes = self.eye_cascade.detectMultiScale(roi_gray, 1.1, 10, minSize=(20, 20))
-                if len(eyes) >= 2:
+            for eyes_open in self.detector.eyes_open(image, faces, tracker):
+                if eyes_open:
                     tags.append("eyes_open")
                 else:
                     tags.append("eyes_closed_or_distracted")
         else:
             tags.append("no_human_visible")
         return tags
-    def process_training(self, data_path, progress_callback):
-        all_files = [f for f in os.listdir(data_path)]
-        for index, filename in enumerate(all_files):
-            # Sửa domain: focus_1.jfif -> domain 'focus'
-            domain = filename.split('_')[0] if '_' in filename else filename.split('.')[0]
-            file_path = os.path.join(data_path, filename)
-            ext = os.path.splitext(filename)[1].lower()
-
-            words = self._extract_features(file_path) if ext in self.image_extensions else []
-            if not words: # Nếu là file text nhãn
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        words = f.read().lower().split()
-                except: continue
-
-            # Logic kết tinh hình học (Giữ nguyên như bản cũ của bạn)
-            if domain not in self.domain_vectors:
-                v = np.random.uniform(-1, 1, 3)
-                self.domain_vectors[domain] = v / np.linalg.norm(v)
-            
-            d_vec = self.domain_vectors[domain]
-            for i in range(len(words)-1):
-                w1, w2 = words[i], words[i+1]
-                if w1 not in self.vertices: self.vertices[w1] = np.random.normal(0, 5, 3)
-                if w2 not in self.vertices: self.vertices[w2] = self.vertices[w1] + (d_vec * 2.0)
-                eid = f"{w1}<->{w2}" if w1 < w2 else f"{w2}<->{w1}"
-                self.edges[eid] = self.edges.get(eid, 0) + 0.1
-
-            progress_callback(f"Kết tinh: {filename}", int((index+1)/len(all_files)*100), len(self.vertices), len(self.edges))
-        self.save_all()
-        
-    def save_all(self):
+
+    def extract_features_batch(self, frames_or_paths, workers=None, chunksize=4):
+        """ Tags for many frames or image paths, yielded in input order.
+            workers > 1 spreads decoding and detection over a process pool whose workers
+            each load the cascades once; None uses every core, 1 stays in this process. """
+        items = list(frames_or_paths)
+        if (workers or os.cpu_count() or 1) <= 1 or len(items) <= 1:
+            for item in items:
+                yield self._extract_features(item)
+            return
+        yield from self._pool_map(_worker_extract, items, workers, chunksize)
+
+    def process_training(self, data_path, progress_callback, workers=1, rebuild=False, checkpoint_every=200):
+        """ Incremental: files already in Brain/training_manifest.db (same size and mtime, or
+            same content hash) are skipped and training continues on the saved brain.
+            rebuild=True starts the graph over from every file but reuses cached words, so
+            no image is decoded again. The brain and manifest are checkpointed every
+            checkpoint_every files; an interrupted run picks up from the last checkpoint.
+            workers > 1 (or None for every core) reads and detects new files in parallel. """
+        brain_dir = "./Brain"
+        brain_path = os.path.join(brain_dir, "crystal_brain.pb")
+        manifest = TrainingManifest(os.path.join(brain_dir, "training_manifest.db"))
+        if rebuild:
+            self.vertices = VertexStore()
+            self.edges = EdgeStore(self.vertices)
+            self.domain_vectors = {}
+            manifest.reset_ingested()
+        elif not len(self.vertices) and os.path.exists(brain_path):
+            self.load_brain(brain_path)
+
+        todo = []  # (filename, path, sha1, cached, words)
+        for filename in os.listdir(data_path):
+            path = os.path.join(data_path, filename)
+            if not os.path.isfile(path): continue
+            needed, sha1 = manifest.pending(path)
+            if needed:
+                cached, words = manifest.cached_words(sha1)
+                todo.append((filename, path, sha1, cached, words))
+        if not todo:
+            progress_callback("Không có file mới", 100, len(self.vertices), len(self.edges))
+            manifest.checkpoint()
+            manifest.close()
+            return
+
+        uncached = [path for _, path, _, cached, _ in todo if not cached]
+        if workers == 1:
+            fresh = (_file_words(self, p) for p in uncached)
+        else:
+            fresh = self._pool_map(_worker_file_words, uncached, workers)
+
+        try:
+            for index, (filename, path, sha1, cached, words) in enumerate(todo):
+                if not cached:
+                    words = next(fresh)
+                    manifest.store_words(sha1, words)
+                if words is not None:
+                    # Sửa domain: focus_1.jfif -> domain 'focus'
+                    domain = filename.split('_')[0] if '_' in filename else filename.split('.')[0]
+                    self._crystallize(domain, words)
+                manifest.mark_ingested(path)
+                progress_callback(f"Kết tinh: {filename}", int((index+1)/len(todo)*100), len(self.vertices), len(self.edges))
+                if (index + 1) % checkpoint_every == 0:
+                    self._checkpoint(brain_path, manifest)
+            self.save_all()
+            manifest.checkpoint()
+        finally:
+            manifest.close()
+
+    def _checkpoint(self, brain_path, manifest):
+        """ Brain first, then the manifest: a crash in between at worst re-ingests one batch """
+        os.makedirs(os.path.dirname(brain_path), exist_ok=True)
+        brain_format.save_brain(brain_path, self.vertices, self.edges, self.domain_vectors)
+        manifest.checkpoint()
+
+    def _pool_map(self, func, items, workers, chunksize=4):
+        workers = workers or os.cpu_count() or 1
+        if not items: return
+        with multiprocessing.get_context("spawn").Pool(min(workers, len(items)), initializer=_init_worker,
+                                                      initargs=(self.detector.name,)) as pool:
+            yield from pool.imap(func, items, chunksize)
+
+    def _crystallize(self, domain, words):
+        # Logic kết tinh hình học (Giữ nguyên như bản cũ của bạn)
+        if domain not in self.domain_vectors:
+            v = np.random.uniform(-1, 1, 3)
+            self.domain_vectors[domain] = v / np.linalg.norm(v)
+
+        d_vec = self.domain_vectors[domain]
+        if len(words) < 2: return
+        ids, first = self.vertices.intern_many(words)
+        # A new word sits one domain step past the word before it; only the first word
+        # of a document can be new with no predecessor, and it is placed at random.
+        coords, step = self.vertices.coords, d_vec * 2.0
+        for j in np.flatnonzero(first):
+            coords[ids[j]] = np.random.normal(0, 5, 3) if j == 0 else coords[ids[j-1]] + step
+        self.edges.add_bigrams(ids, 0.1)
+
+    def save_all(self, map_format="obj"):
         brain_dir = "./Brain"
         if not os.path.exists(brain_dir): os.makedirs(brain_dir)
         
-        # Lưu dữ liệu nhị phân
-        with open(os.path.join(brain_dir, "crystal_brain.pb"), 'wb') as f:
-            pickle.dump({"vertices": self.vertices, "edges": self.edges}, f)
+        # Lưu dữ liệu nhị phân (brain_format.py: header + string table + raw arrays, atomic)
+        brain_format.save_brain(os.path.join(brain_dir, "crystal_brain.pb"), self.vertices, self.edges, self.domain_vectors)
         
-        # Xuất file 3D để quan sát vùng xao nhãng
-        self.export_to_obj(os.path.join(brain_dir, "knowledge_map.obj"))
+        # Xuất file 3D để quan sát vùng xao nhãng ("ply": compact binary for large maps)
+        if map_format == "obj":
+            self.export_to_obj(os.path.join(brain_dir, "knowledge_map.obj"))
+        elif map_format == "ply":
+            self.export_to_ply(os.path.join(brain_dir, "knowledge_map.ply"))
+
+    def load_brain(self, path=None):
+        """ Maps a saved brain (memmap, no deserialization); training can continue on top of it """
+        path = path or resource_path("Brain/crystal_brain.pb")
+        self.vertices, self.edges, self.domain_vectors = brain_format.load_brain(path)
 
     def export_to_obj(self, filename):
-        if not self.vertices: return
-        with open(filename, 'w', buffering=1024*1024*10) as f:
-            f.write("# Crystal Engine 3D Knowledge Map\n")
-            word_to_id = {}
-            idx = 1
-            for word, coord in self.vertices.items():
-                word_to_id[word] = idx
-                f.write(f"v {coord[0]:.4f} {coord[1]:.4f} {coord[2]:.4f}\n")
-                idx += 1
-            for edge_id in self.edges.keys():
-                w1, w2 = edge_id.split("<->")
-                if w1 in word_to_id and w2 in word_to_id:
-                    f.write(f"l {word_to_id[w1]} {word_to_id[w2]}\n")
\ No newline at end of file
+        """ Appends only what was added since the last export when the graph just grew """
+        if not len(self.vertices): return
+        return map_export.export_obj(filename, self.vertices, self.edges)
+
+    def export_to_ply(self, filename):
+        if not len(self.vertices): return
+        map_export.export_ply(filename, self.vertices, self.edges)
+
+# --- PROCESS POOL WORKERS ---
+# Module level so "spawn" workers (Windows, macOS, frozen builds) can import them.
+
+_worker_engine = None
+
+def _init_worker(detector="haar"):
+    global _worker_engine
+    cv2.setNumThreads(1)  # one core per worker; the pool provides the parallelism
+    _worker_engine = CrystalEngine(detector=detector)
+
+def _worker_extract(item):
+    return _worker_engine._extract_features(item)
+
+def _file_words(engine, file_path):
+    """ Tags for an image, or the lowercased words of a label text file; None if unreadable """
+    ext = os.path.splitext(file_path)[1].lower()
+    words = engine._extract_features(file_path) if ext in engine.image_extensions else []
+    if not words: # Nếu là file text nhãn
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                words = f.read().lower().split()
+        except: return None
+    return words
+
+def _worker_file_words(file_path):
+    return _file_words(_worker_engine, file_path)
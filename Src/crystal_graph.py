@@ -0,0 +1,194 @@
+import numpy as np # type: ignore
+
+class VertexStore:
+    """ Token -> 3D position, stored as one contiguous float32 N x 3 matrix.
+        Tokens are interned to row ids; the matrix grows geometrically. Behaves like the
+        old dict of 3-element arrays (get/[]/in/len/items) for existing callers. """
+    def __init__(self, capacity=1024):
+        self._index = {}                # token -> row id (built lazily for loaded brains)
+        self.tokens = []                # row id -> token
+        self.coords = np.zeros((capacity, 3), dtype=np.float32)
+
+    @classmethod
+    def from_arrays(cls, tokens, coords):
+        """ Wraps loaded data (e.g. a brain_format.StringTable and a memmap) without copying """
+        store = cls.__new__(cls)
+        store._index = None
+        store.tokens = tokens
+        store.coords = coords
+        return store
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {t: i for i, t in enumerate(self.tokens)}
+        return self._index
+
+    @property
+    def matrix(self):
+        return self.coords[:len(self.tokens)]
+
+    def _reserve(self, n):
+        if n > len(self.coords):
+            grown = np.zeros((max(n, len(self.coords) * 2), 3), dtype=np.float32)
+            grown[:len(self.coords)] = self.coords
+            self.coords = grown
+
+    def intern_many(self, words):
+        """ Row ids for words, adding unknown tokens (at the origin). Returns (ids, first)
+            where first marks the positions at which a token was seen for the first time. """
+        ids = np.empty(len(words), dtype=np.int64)
+        first = np.zeros(len(words), dtype=bool)
+        index, tokens = self.index, self.tokens
+        for i, w in enumerate(words):
+            row = index.get(w)
+            if row is None:
+                row = index[w] = len(tokens)
+                tokens.append(w)
+                first[i] = True
+            ids[i] = row
+        self._reserve(len(tokens))
+        return ids, first
+
+    def __getitem__(self, token):
+        return self.coords[self.index[token]]
+
+    def __setitem__(self, token, value):
+        row = self.index.get(token)
+        if row is None:
+            row = self.index[token] = len(self.tokens)
+            self.tokens.append(token)
+            self._reserve(len(self.tokens))
+        self.coords[row] = value
+
+    def get(self, token, default=None):
+        row = self.index.get(token)
+        return default if row is None else self.coords[row]
+
+    def __contains__(self, token):
+        return token in self.index
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def keys(self):
+        return list(self.tokens)
+
+    def values(self):
+        return list(self.matrix)
+
+    def items(self):
+        return zip(self.tokens, self.matrix)
+
+class EdgeStore:
+    """ Undirected weighted edges between vertex ids as COO arrays (src, dst, weight),
+        with src <= dst. Dict-style access still uses the old "w1<->w2" keys. """
+    def __init__(self, vertices, capacity=4096):
+        self.vertices = vertices
+        self._lookup = {}               # (src << 32) | dst -> edge id (built lazily for loaded brains)
+        self.src = np.zeros(capacity, dtype=np.int32)
+        self.dst = np.zeros(capacity, dtype=np.int32)
+        self.weights = np.zeros(capacity, dtype=np.float64)
+        self.n = 0
+
+    @classmethod
+    def from_arrays(cls, vertices, src, dst, weights):
+        store = cls.__new__(cls)
+        store.vertices = vertices
+        store._lookup = None
+        store.src, store.dst, store.weights = src, dst, weights
+        store.n = len(src)
+        return store
+
+    @property
+    def lookup(self):
+        if self._lookup is None:
+            keys = (self.src[:self.n].astype(np.int64) << 32) | self.dst[:self.n]
+            self._lookup = dict(zip(keys.tolist(), range(self.n)))
+        return self._lookup
+
+    def _reserve(self, n):
+        if n > len(self.src):
+            size = max(n, len(self.src) * 2)
+            for name in ("src", "dst", "weights"):
+                old = getattr(self, name)
+                grown = np.zeros(size, dtype=old.dtype)
+                grown[:self.n] = old[:self.n]
+                setattr(self, name, grown)
+
+    def edge_ids(self, a, b):
+        """ Edge ids for the vertex id pairs (a[i], b[i]), creating missing edges with weight 0 """
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        keys = (lo << 32) | hi
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        ids = np.empty(len(uniq), dtype=np.int64)
+        new = []
+        for i, k in enumerate(uniq.tolist()):
+            eid = self.lookup.get(k)
+            if eid is None:
+                eid = self.lookup[k] = self.n + len(new)
+                new.append(k)
+            ids[i] = eid
+        if new:
+            self._reserve(self.n + len(new))
+            new = np.array(new, dtype=np.int64)
+            self.src[self.n:self.n + len(new)] = new >> 32
+            self.dst[self.n:self.n + len(new)] = new & 0xFFFFFFFF
+            self.n += len(new)
+        return ids[inverse]
+
+    def add_bigrams(self, ids, amount):
+        """ Adds amount to the edge of every consecutive pair in ids, repeats included """
+        if len(ids) < 2: return
+        eids = self.edge_ids(ids[:-1], ids[1:])  # may grow self.weights: resolve it after
+        np.add.at(self.weights, eids, amount)
+
+    @property
+    def pairs(self):
+        return self.src[:self.n], self.dst[:self.n]
+
+    def _key_ids(self, key):
+        w1, w2 = key.split("<->")
+        a, b = self.vertices.index[w1], self.vertices.index[w2]
+        return (min(a, b) << 32) | max(a, b)
+
+    def _name(self, eid):
+        t = self.vertices.tokens
+        w1, w2 = t[self.src[eid]], t[self.dst[eid]]
+        return f"{w1}<->{w2}" if w1 < w2 else f"{w2}<->{w1}"
+
+    def __getitem__(self, key):
+        try:
+            return float(self.weights[self.lookup[self._key_ids(key)]])
+        except (KeyError, ValueError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, weight):
+        w1, w2 = key.split("<->")
+        ids = self.vertices.intern_many([w1, w2])[0]
+        eid = self.edge_ids(ids[:1], ids[1:])[0]
+        self.weights[eid] = weight
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return (self._name(e) for e in range(self.n))
+
+    def keys(self):
+        return list(iter(self))
+
+    def items(self):
+        return [(self._name(e), float(self.weights[e])) for e in range(self.n)]
@@ -0,0 +1,140 @@
+""" Face / eye-state detector backends for CrystalEngine.
+
+    Every backend answers the same two questions, so _extract_features emits the same tags
+    whichever one runs:
+
+        prepare(bgr)                    the image the backend works on (gray for Haar, BGR for YuNet);
+                                        FaceTracker crops and resizes it the same way for both
+        detect(image, min_side)         face boxes (x, y, w, h) in image coordinates
+        eyes_open(image, faces, tracker) one bool per face
+
+    haar    the two cascades in cascades/ (default)
+    yunet   cv2.FaceDetectorYN (OpenCV >= 4.8) with the YuNet ONNX model from OpenCV Zoo
+            (face_detection_yunet_2023mar.onnx in models/, or GFOCUS_YUNET_MODEL). Eye state:
+            the detected faces are cropped and tiled into one image for a single batched
+            YuNet pass, and the eye cascade confirms an open eye in a small patch around
+            each eye landmark.
+
+    Pick one with CrystalEngine(detector="yunet") or the GFOCUS_DETECTOR environment variable.
+"""
+import os
+import numpy as np # type: ignore
+import cv2 # type: ignore
+
+class HaarDetector:
+    name = "haar"
+
+    def __init__(self, face_path, eye_path):
+        self.face_cascade = cv2.CascadeClassifier(face_path)
+        self.eye_cascade = cv2.CascadeClassifier(eye_path)
+
+        # Safety Check: Print error if files failed to load
+        if self.face_cascade.empty():
+            print(f"ERROR: Could not load face cascade at: {face_path}")
+        if self.eye_cascade.empty():
+            print(f"ERROR: Could not load eye cascade at: {eye_path}")
+
+    def ready(self):
+        return not self.face_cascade.empty()
+
+    def prepare(self, img):
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    def detect(self, gray, min_side):
+        return [tuple(int(v) for v in f) for f in self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(min_side, min_side))]
+
+    def eyes_open(self, gray, faces, tracker=None):
+        result = []
+        for (x, y, w, h) in faces:
+            if tracker is None:
+                roi_gray = gray[y:y+h, x:x+w]
+                eyes = self.eye_cascade.detectMultiScale(roi_gray, 1.1, 10, minSize=(20, 20))
+            else:
+                # Live video: eyes only in the upper band of the face, downscaled
+                roi_gray = gray[y:y+int(h*tracker.EYE_BAND), x:x+w]
+                scale = min(1.0, tracker.EYE_FACE_PX / float(w))
+                if scale < 1.0:
+                    roi_gray = cv2.resize(roi_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                side = max(12, int(20 * scale))
+                eyes = self.eye_cascade.detectMultiScale(roi_gray, 1.1, 10, minSize=(side, side))
+            result.append(len(eyes) >= 2)
+        return result
+
+class YuNetDetector:
+    name = "yunet"
+    SCORE = 0.7
+    TILE = 160          # side of each face tile in the batched eye-state pass
+    CROP = 1.4          # tile covers the face box grown by this factor (whole head visible)
+    EYE_PATCH = 0.2     # half side of the patch around an eye landmark, as a fraction of face width
+
+    def __init__(self, model_path, eye_path):
+        self.model = cv2.FaceDetectorYN.create(model_path, "", (320, 320), self.SCORE, 0.3, 50)
+        self.eye_cascade = cv2.CascadeClassifier(eye_path)
+        self.size = (320, 320)
+
+    def ready(self):
+        return not self.eye_cascade.empty()
+
+    def prepare(self, img):
+        return img
+
+    def _run(self, image):
+        size = (image.shape[1], image.shape[0])
+        if size != self.size:
+            self.model.setInputSize(size)
+            self.size = size
+        _, found = self.model.detect(image)
+        return [] if found is None else found
+
+    def detect(self, img, min_side):
+        return [tuple(int(v) for v in f[:4]) for f in self._run(img) if f[2] >= min_side and f[3] >= min_side]
+
+    def _tile(self, img, box):
+        x, y, w, h = box
+        side = int(max(w, h) * self.CROP)
+        x0, y0 = int(x + w / 2 - side / 2), int(y + h / 2 - side / 2)
+        H, W = img.shape[:2]
+        crop = img[max(0, y0):min(H, y0 + side), max(0, x0):min(W, x0 + side)]
+        # Faces at the frame edge: pad so the face stays centred in its tile
+        crop = cv2.copyMakeBorder(crop, max(0, -y0), max(0, y0 + side - H), max(0, -x0), max(0, x0 + side - W), cv2.BORDER_CONSTANT)
+        return cv2.resize(crop, (self.TILE, self.TILE), interpolation=cv2.INTER_AREA)
+
+    def eyes_open(self, img, faces, tracker=None):
+        if len(faces) == 0: return []
+        T = self.TILE
+        mosaic = np.hstack([self._tile(img, f) for f in faces])
+        result = [False] * len(faces)
+        for f in self._run(mosaic):
+            i = int((f[0] + f[2] / 2) // T)   # tile holding this face's centre
+            if 0 <= i < len(faces) and not result[i]:
+                result[i] = self._eyes_visible(mosaic[:, i*T:(i+1)*T], f, i * T)
+        return result
+
+    def _eyes_visible(self, tile, f, offset):
+        gray = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+        r = max(10, int(f[2] * self.EYE_PATCH))
+        # YuNet landmarks: right eye (4, 5), left eye (6, 7)
+        for ex, ey in ((f[4] - offset, f[5]), (f[6] - offset, f[7])):
+            ex, ey = int(ex), int(ey)
+            patch = gray[max(0, ey - r):ey + r, max(0, ex - r):ex + r]
+            if patch.size == 0 or len(self.eye_cascade.detectMultiScale(patch, 1.1, 3, minSize=(r // 2, r // 2))) == 0:
+                return False
+        return True
+
+BACKENDS = ("haar", "yunet")
+
+def create_detector(name, paths):
+    """ paths: resolves a path relative to Src (CrystalEngine's resource_path). Falls back to
+        Haar, with a printed reason, when YuNet cannot be loaded. """
+    eye_path = paths("cascades/haarcascade_eye.xml")
+    if name == "yunet":
+        model_path = os.getenv("GFOCUS_YUNET_MODEL") or paths("models/face_detection_yunet_2023mar.onnx")
+        try:
+            if not hasattr(cv2, "FaceDetectorYN"):
+                raise RuntimeError(f"OpenCV {cv2.__version__} has no FaceDetectorYN (needs 4.8+)")
+            return YuNetDetector(model_path, eye_path)
+        except (cv2.error, RuntimeError) as e:
+            print(f"ERROR: YuNet detector unavailable ({e}); using Haar cascades")
+    elif name != "haar":
+        print(f"ERROR: Unknown detector '{name}'; using Haar cascades")
+    return HaarDetector(paths("cascades/haarcascade_frontalface_default.xml"), eye_path)
@@ -1,15 +1,17 @@
-import cv2
-import pickle
-import os
 import time
-import threading
+T0 = time.perf_counter()  # cold-start reference for the startup profile
+import multiprocessing
+import os
 import random
-import requests
+import threading
 import tkinter as tk
 import sys
 from datetime import datetime
-from PIL import Image, ImageTk
-from crystal_engine import CrystalEngine
+from startup import StartupProfile
+
+# Heavy modules (OpenCV, numpy, PIL, requests, the engine) are imported by
+# FullScreenMonitorApp.load_engine on a background thread, after the window is up
+cv2 = np = Image = ImageTk = CapturePipeline = None
 
 # --- CONFIG & CYBER PALETTE ---
 SERVER_URL = "https://gfocusapi.scarlet-technology.com/"
@@ -34,20 +36,67 @@ class FullScreenMonitorApp:
         self.window.title("GFOCUS EXECUTIVE")
         self.window.attributes('-fullscreen', True)
         self.window.configure(bg=BG_MAIN)
-        
-        # Core Logic Components
-        self.engine = CrystalEngine()
+        self.profile = StartupProfile(T0)
+
+        # Core Logic Components (engine and reporter arrive with load_engine)
+        self.engine = None
+        self.reporter = None
+        self.ready = False
+        self.loaded = threading.Event()
+        self.load_error = None
         self.my_code = str(random.randint(100000, 999999))
         self.running = False
-        self.is_processing_ai = False
+        self.pipeline = None
+        self.photo = None
+        self.last_stats_log = 0
         self.current_session_id = 0
         self.start_timestamp = 0
         self.distract_counter = 0
         self.last_send_time = 0
         self.cap = None
 
-        self.setup_ui()
-        self.window.bind("<Escape>", lambda e: self.on_closing())
+        with self.profile.phase("build ui"):
+            self.setup_ui()
+            self.window.bind("<Escape>", lambda e: self.on_closing())
+            self.window.update_idletasks()
+        self.profile.mark("window")
+        threading.Thread(target=self.load_engine, daemon=True).start()
+        self.window.after(50, self.poll_ready)
+
+    def load_engine(self):
+        """ Background thread: heavy imports and cascade loading, off the window's critical path """
+        global cv2, np, Image, ImageTk, CapturePipeline
+        try:
+            with self.profile.phase("import numpy"): import numpy as np # type: ignore
+            with self.profile.phase("import cv2"): import cv2 # type: ignore
+            with self.profile.phase("import PIL"): from PIL import Image, ImageTk
+            with self.profile.phase("import status_client"): from status_client import StatusReporter
+            with self.profile.phase("import pipeline"): from pipeline import CapturePipeline
+            with self.profile.phase("import crystal_engine"): from crystal_engine import CrystalEngine
+            with self.profile.phase("load cascades"): self.engine = CrystalEngine(tracking=True)
+            self.reporter = StatusReporter(SERVER_URL, self.my_code)
+            # Preallocated display buffers (800x450), reused for every rendered frame
+            self.display_bgr = np.empty((450, 800, 3), dtype=np.uint8)
+            self.display_rgb = np.empty((450, 800, 3), dtype=np.uint8)
+        except Exception as e:
+            self.load_error = e
+        self.loaded.set()
+
+    def poll_ready(self):
+        """ UI thread: enables START ENGINE once load_engine is done """
+        if not self.loaded.is_set():
+            self.window.after(50, self.poll_ready)
+            return
+        if self.load_error is not None:
+            self.btn_toggle.config(text="ENGINE ERROR", bg=ACCENT_RED, fg="white", cursor="")
+            self.add_log(f"CRITICAL: {self.load_error}")
+            return
+        self.ready = True
+        self.profile.mark("ready")
+        self.btn_toggle.config(text="START ENGINE", bg=ACCENT_CYAN, fg="black", cursor="hand2")
+        self.add_log(f"Engine Ready ({self.profile.marks['ready']:.2f}s)")
+        self.profile.save()
+        print(f"Startup: {self.profile.summary()}")
 
     def setup_ui(self):
         # --- LEFT SIDEBAR ---
@@ -62,7 +111,7 @@ class FullScreenMonitorApp:
         self.log_box = tk.Text(self.sidebar, bg="#050505", fg=ACCENT_GREEN, font=("Courier", 10),
                                height=12, bd=0, padx=15, pady=15, state="disabled")
         self.log_box.pack(fill="x", padx=20, pady=30)
-        self.add_log("System Ready...")
+        self.add_log("Loading Engine...")
 
         # --- DOCKED CONTROLS ---
         self.controls = tk.Frame(self.sidebar, bg=BG_SIDE)
@@ -72,8 +121,8 @@ class FullScreenMonitorApp:
         tk.Label(self.controls, text=self.my_code, fg="white", bg=BG_SIDE, font=("Courier", 26, "bold")).pack(pady=(5, 25))
 
         # Start/Stop Label (Mac style button)
-        self.btn_toggle = tk.Label(self.controls, text="START ENGINE", fg="black", bg=ACCENT_CYAN,
-                                   font=("Arial Black", 12), width=20, height=2, cursor="hand2")
+        self.btn_toggle = tk.Label(self.controls, text="LOADING...", fg="black", bg=TEXT_DIM,
+                                   font=("Arial Black", 12), width=20, height=2, cursor="watch")
         self.btn_toggle.pack(padx=20)
         self.btn_toggle.bind("<Button-1>", lambda e: self.toggle_session())
 
@@ -97,6 +146,7 @@ class FullScreenMonitorApp:
         self.log_box.config(state="disabled")
 
     def toggle_session(self):
+        if not self.ready: return  # gated until load_engine is done
         if not self.running:
             self.cap = cv2.VideoCapture(0)
             if not self.cap.isOpened():
@@ -113,6 +163,9 @@ class FullScreenMonitorApp:
             
             # Using your old working endpoint
             self.send_to_server(False, "Focusing", self.current_session_id)
+            self.engine.tracker.reset()
+            self.pipeline = CapturePipeline(self.cap, self.check_ai)
+            self.pipeline.start()
             self.update_loop()
         else:
             self.stop_session()
@@ -121,85 +174,83 @@ class FullScreenMonitorApp:
         self.running = False
         self.btn_toggle.config(text="START ENGINE", bg=ACCENT_CYAN, fg="black")
         self.video_wrap.config(bg="#1E2024")
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
         if self.cap: self.cap.release()
         self.add_log("Session Ended.")
         self.send_to_server(False, "Stopped", 0)
 
     def update_loop(self):
-        if self.running and self.cap:
-            ret, frame = self.cap.read()
-            if ret:
-                elapsed = int(time.time() - self.start_timestamp)
-                self.lbl_timer.config(text=time.strftime('%H:%M:%S', time.gmtime(elapsed)))
-                
-                if not self.is_processing_ai:
-                    threading.Thread(target=self.check_ai, args=(frame.copy(),), daemon=True).start()
-                
+        """ Render stage only: capture and inference run on their own threads (pipeline.py) """
+        if self.running and self.pipeline:
+            elapsed = int(time.time() - self.start_timestamp)
+            self.lbl_timer.config(text=time.strftime('%H:%M:%S', time.gmtime(elapsed)))
+
+            frame = self.pipeline.latest_for_render()
+            if frame is not None:
                 # Resizing matching your old working code
-                img_display = cv2.cvtColor(cv2.resize(frame, (800, 450)), cv2.COLOR_BGR2RGB)
-                imgtk = ImageTk.PhotoImage(image=Image.fromarray(img_display))
-                self.lbl_video.imgtk = imgtk
-                self.lbl_video.configure(image=imgtk)
-            
+                cv2.resize(frame, (800, 450), dst=self.display_bgr)
+                cv2.cvtColor(self.display_bgr, cv2.COLOR_BGR2RGB, dst=self.display_rgb)
+                image = Image.fromarray(self.display_rgb)
+                if self.photo is None:
+                    self.photo = ImageTk.PhotoImage(image=image)
+                    self.lbl_video.imgtk = self.photo
+                    self.lbl_video.configure(image=self.photo)
+                else:
+                    self.photo.paste(image)
+
+            if time.time() - self.last_stats_log > 30:
+                self.last_stats_log = time.time()
+                st = self.pipeline.stats()
+                self.add_log(f"cap {st['capture_fps']} | ai {st['infer_fps']} (-{st['infer_dropped']}) | ui {st['render_fps']} fps")
+                rs = self.reporter.stats()
+                self.add_log(f"sent {rs['events']} (-{rs['events_skipped']}) | proofs {rs['proofs']} (-{rs['proofs_skipped']}) @{rs['proof_width']}px q{rs['proof_quality']}")
+
             # Use your old working interval (35ms)
             self.window.after(35, self.update_loop)
 
     def check_ai(self, frame):
-        self.is_processing_ai = True
-        try:
-            tags = self.engine._extract_features(frame)
-            is_bad = any(t in ["eyes_closed_or_distracted", "no_human_visible"] for t in tags)
-            
-            now = time.time()
-            if is_bad:
-                self.distract_counter += 1
-                if self.distract_counter >= 6:
-                    self.window.after(0, lambda: self.video_wrap.config(bg=ACCENT_RED))
-                    if now - self.last_send_time > 3:
-                        self.last_send_time = now
-                        self.send_to_server(True, "Distracted", self.current_session_id, frame)
-            else:
-                self.window.after(0, lambda: self.video_wrap.config(bg=ACCENT_CYAN))
-                if self.distract_counter >= 6:
-                    self.send_to_server(False, "Focusing", self.current_session_id)
+        """ Runs on the pipeline's inference worker; frame is its reused buffer """
+        tags = self.engine._extract_features(frame)
+        is_bad = any(t in ["eyes_closed_or_distracted", "no_human_visible"] for t in tags)
+
+        now = time.time()
+        if is_bad:
+            self.distract_counter += 1
+            if self.distract_counter >= 6:
+                self.window.after(0, lambda: self.video_wrap.config(bg=ACCENT_RED))
+                if now - self.last_send_time > 3:
                     self.last_send_time = now
-                self.distract_counter = 0
-        finally:
-            self.is_processing_ai = False
+                    self.send_to_server(True, "Distracted", self.current_session_id, frame.copy())
+        else:
+            self.window.after(0, lambda: self.video_wrap.config(bg=ACCENT_CYAN))
+            if self.distract_counter >= 6:
+                self.send_to_server(False, "Focusing", self.current_session_id)
+                self.last_send_time = now
+            self.distract_counter = 0
 
     def send_to_server(self, is_bad, reason, session_id, frame=None):
+        if self.reporter is None: return
         elapsed_seconds = int(time.time() - self.start_timestamp) if self.running else 0
-    
-        def _bg_send():
-            status_str = "True" if is_bad else "False"
-            data = {
-                "code": self.my_code,
-                "is_distracted": status_str,
-                "reason": reason,
-                "session_id": session_id,
-                "seconds": elapsed_seconds,
-                "timestamp": datetime.now().strftime("%H:%M:%S")
-            }
-            files = {}
-            if frame is not None and is_bad:
-                # Resize to make upload faster
-                small_frame = cv2.resize(frame, (640, 360))
-                _, img_encoded = cv2.imencode('.jpg', small_frame)
-                # The key 'image' must match request.files['image'] in server.py
-                files = {'image': ('image.jpg', img_encoded.tobytes(), 'image/jpeg')}
-            
-            try:
-                # Updated to your old working endpoint: /update_status
-                requests.post(f"{SERVER_URL}/update_status", data=data, files=files, timeout=10)
-            except: pass
-
-        threading.Thread(target=_bg_send, daemon=True).start()
+        event = {
+            "is_distracted": is_bad,
+            "reason": reason,
+            "session_id": session_id,
+            "seconds": elapsed_seconds,
+            "timestamp": datetime.now().strftime("%H:%M:%S")
+        }
+        # Only changes go out (plus a heartbeat); batched, ordered and replayed by the reporter thread
+        self.reporter.report(event, frame if is_bad else None)
 
     def on_closing(self):
         self.stop_session()
+        if self.reporter: self.reporter.close()
         self.window.destroy()
 
 if __name__ == "__main__":
+    # Frozen builds: lets CrystalEngine's process pool workers start
+    multiprocessing.freeze_support()
     root = tk.Tk()
     # Forces standard tk button color behavior for Mac
     root.tk.call('tk', 'windowingsystem') 
@@ -0,0 +1,78 @@
+""" Knowledge map export (OBJ text and binary PLY) straight from the graph arrays.
+
+    OBJ export is incremental: a sidecar "<file>.state" remembers how many vertices and
+    edges were written and a fingerprint of them. When the graph has only grown since
+    (same prefix), just the new "v" and "l" lines are appended; otherwise the file is
+    rewritten. Lines are formatted in bulk, one %-format per chunk of rows.
+"""
+import os
+import json
+import hashlib
+import numpy as np # type: ignore
+
+CHUNK_ROWS = 65536
+OBJ_HEADER = "# Crystal Engine 3D Knowledge Map\n"
+
+def _write_rows(f, fmt, rows):
+    """ Formats a 2D array with one line template per row, CHUNK_ROWS at a time """
+    for start in range(0, len(rows), CHUNK_ROWS):
+        block = rows[start:start + CHUNK_ROWS]
+        f.write((fmt * len(block)) % tuple(block.ravel().tolist()))
+
+def _fingerprint(coords, src, dst):
+    h = hashlib.sha1()
+    for a in (coords, src, dst):
+        h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()
+
+def _load_state(filename):
+    try:
+        with open(filename + ".state") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def export_obj(filename, vertices, edges):
+    """ Writes or appends to an OBJ file; returns "append", "rewrite" or "unchanged" """
+    coords = vertices.matrix
+    src, dst = edges.pairs
+    n_v, n_e = len(coords), len(src)
+    state = _load_state(filename)
+
+    mode = "rewrite"
+    if (state and os.path.exists(filename) and os.path.getsize(filename) == state["size"]
+            and state["vertices"] <= n_v and state["edges"] <= n_e
+            and state["fingerprint"] == _fingerprint(coords[:state["vertices"]], src[:state["edges"]], dst[:state["edges"]])):
+        mode = "unchanged" if (state["vertices"], state["edges"]) == (n_v, n_e) else "append"
+    if mode == "unchanged":
+        return mode
+    first_v, first_e = (state["vertices"], state["edges"]) if mode == "append" else (0, 0)
+
+    with open(filename, "a" if mode == "append" else "w", buffering=1024*1024*10) as f:
+        if mode == "rewrite": f.write(OBJ_HEADER)
+        _write_rows(f, "v %.4f %.4f %.4f\n", coords[first_v:])
+        # OBJ indices are 1-based and may refer to any vertex defined before the line
+        _write_rows(f, "l %d %d\n", np.column_stack([src[first_e:], dst[first_e:]]).astype(np.int64) + 1)
+
+    with open(filename + ".state", "w") as f:
+        json.dump({"vertices": n_v, "edges": n_e, "size": os.path.getsize(filename),
+                   "fingerprint": _fingerprint(coords, src, dst)}, f)
+    return mode
+
+def export_ply(filename, vertices, edges):
+    """ Binary little-endian PLY with float32 vertices and int32 edge pairs; much smaller
+        and faster to write and load than OBJ for large maps """
+    coords = np.ascontiguousarray(vertices.matrix, dtype="<f4")
+    src, dst = edges.pairs
+    pairs = np.column_stack([src, dst]).astype("<i4")
+    header = (
+        "ply\nformat binary_little_endian 1.0\ncomment Crystal Engine 3D Knowledge Map\n"
+        f"element vertex {len(coords)}\nproperty float x\nproperty float y\nproperty float z\n"
+        f"element edge {len(pairs)}\nproperty int vertex1\nproperty int vertex2\nend_header\n"
+    )
+    tmp = filename + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(coords.tobytes())
+        f.write(pairs.tobytes())
+    os.replace(tmp, filename)
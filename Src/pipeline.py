@@ -0,0 +1,134 @@
+import time
+import threading
+import numpy as np # type: ignore
+
+class StageMeter:
+    """ Counts processed and dropped frames for one stage and reports its FPS """
+    def __init__(self):
+        self.count = 0
+        self.dropped = 0
+        self._window_start = time.time()
+        self._window_count = 0
+        self.fps = 0.0
+
+    def tick(self, dropped=0):
+        self.count += 1
+        self.dropped += dropped
+        self._window_count += 1
+        now = time.time()
+        if now - self._window_start >= 1.0:
+            self.fps = self._window_count / (now - self._window_start)
+            self._window_start, self._window_count = now, 0
+
+class FrameRing:
+    """ Preallocated ring of camera frames. The writer fills slots in place; readers
+        copy the newest one out. No per-frame allocation after the first frame. """
+    def __init__(self, size=3):
+        self.size = size
+        self.slots = None
+        self.seq = 0          # sequence number of the newest complete frame
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+
+    def write_slot(self, shape):
+        """ Slot the writer may fill next (never the one readers see as newest) """
+        if self.slots is None or self.slots[0].shape != shape:
+            self.slots = [np.empty(shape, dtype=np.uint8) for _ in range(self.size)]
+        return self.slots[(self.seq + 1) % self.size]
+
+    def commit(self):
+        with self.lock:
+            self.seq += 1
+            self.new_frame.notify_all()
+
+    def read_latest(self, out, after_seq, timeout=0.5):
+        """ Copies the newest frame newer than after_seq into out (reallocated only if the
+            camera resolution changed). Returns (seq, out) or (after_seq, out) on timeout. """
+        with self.lock:
+            if self.seq <= after_seq:
+                self.new_frame.wait(timeout)
+            if self.seq <= after_seq or self.slots is None:
+                return after_seq, out
+            src = self.slots[self.seq % self.size]
+            if out is None or out.shape != src.shape:
+                out = np.empty_like(src)
+            np.copyto(out, src)
+            return self.seq, out
+
+class CapturePipeline:
+    """ capture thread -> FrameRing -> (inference worker, Tk renderer)
+
+        The capture thread reads the camera straight into ring slots. A single persistent
+        inference worker always takes the newest frame and skips stale ones. The Tk
+        thread only pulls the newest frame for display. """
+    def __init__(self, cap, infer, ring_size=3):
+        self.cap = cap
+        self.infer = infer
+        self.ring = FrameRing(ring_size)
+        self.running = False
+        self.capture_meter = StageMeter()
+        self.infer_meter = StageMeter()
+        self.render_meter = StageMeter()
+        self._render_seq = 0
+        self._render_buf = None
+        self._threads = []
+
+    def start(self):
+        self.running = True
+        self._threads = [threading.Thread(target=self._capture_loop, daemon=True),
+                         threading.Thread(target=self._infer_loop, daemon=True)]
+        for t in self._threads: t.start()
+
+    def stop(self):
+        self.running = False
+        with self.ring.lock:
+            self.ring.new_frame.notify_all()
+        for t in self._threads: t.join(1.0)
+
+    def _capture_loop(self):
+        ret, first = self.cap.read()
+        while self.running and not ret:
+            time.sleep(0.05)
+            ret, first = self.cap.read()
+        shape = first.shape if ret else None
+        while self.running and shape is not None:
+            slot = self.ring.write_slot(shape)
+            ret, frame = self.cap.read(slot)
+            if not ret:
+                time.sleep(0.01)
+                continue
+            if frame is not slot:  # backend could not decode in place
+                if frame.shape != shape:
+                    shape = frame.shape
+                    slot = self.ring.write_slot(shape)
+                np.copyto(slot, frame)
+            self.ring.commit()
+            self.capture_meter.tick()
+
+    def _infer_loop(self):
+        buf, seq = None, 0
+        while self.running:
+            new_seq, buf = self.ring.read_latest(buf, seq)
+            if new_seq == seq: continue
+            dropped = new_seq - seq - 1 if seq else 0
+            seq = new_seq
+            try:
+                self.infer(buf)
+            except Exception as e:
+                print(f"Inference error: {e}")
+            self.infer_meter.tick(dropped)
+
+    def latest_for_render(self):
+        """ Newest frame not yet rendered, or None. Called from the Tk thread. """
+        seq, self._render_buf = self.ring.read_latest(self._render_buf, self._render_seq, timeout=0)
+        if seq == self._render_seq: return None
+        self.render_meter.tick(seq - self._render_seq - 1 if self._render_seq else 0)
+        self._render_seq = seq
+        return self._render_buf
+
+    def stats(self):
+        return {
+            "capture_fps": round(self.capture_meter.fps, 1),
+            "infer_fps": round(self.infer_meter.fps, 1), "infer_dropped": self.infer_meter.dropped,
+            "render_fps": round(self.render_meter.fps, 1), "render_dropped": self.render_meter.dropped,
+        }
@@ -0,0 +1,50 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+class StartupProfile:
+    """ Cold-start timings for the desktop app, in seconds since t0 (the first line of
+        main.py, before any heavy import). Phases may be recorded from any thread.
+
+        save() appends one JSON line per launch, so cold start can be tracked across builds.
+        Interpreter / PyInstaller bootloader time before t0 is not included: for dev runs,
+        python -X importtime main.py still gives the per-module breakdown. """
+    def __init__(self, t0=None):
+        self.t0 = t0 if t0 is not None else time.perf_counter()
+        self.phases = []   # (name, start, end)
+        self.marks = {}    # milestone -> time
+
+    def _now(self):
+        return round(time.perf_counter() - self.t0, 4)
+
+    @contextmanager
+    def phase(self, name):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, self._now()))
+
+    def mark(self, name):
+        self.marks[name] = self._now()
+
+    def report(self):
+        return {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"), "frozen": bool(getattr(sys, "frozen", False)),
+            "python": sys.version.split()[0], "marks": dict(self.marks),
+            "phases": [{"name": n, "start": s, "seconds": round(e - s, 4)} for n, s, e in self.phases],
+        }
+
+    def summary(self):
+        """ One log line: milestones, then the slowest phases """
+        marks = " | ".join(f"{k} {v:.2f}s" for k, v in self.marks.items())
+        slow = sorted(self.phases, key=lambda p: p[1] - p[2])[:3]
+        return marks + " | slowest: " + ", ".join(f"{n} {e - s:.2f}s" for n, s, e in slow)
+
+    def save(self, path="startup_profile.jsonl"):
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps(self.report()) + "\n")
+        except OSError:
+            pass  # read-only install dir: the log line is enough
@@ -0,0 +1,203 @@
+import time
+import json
+import threading
+from collections import deque
+
+import cv2 # type: ignore
+import numpy as np # type: ignore
+import requests
+
+HEARTBEAT_SECS = 60          # an unchanged state is re-sent this often, carrying the timer
+PROOF_HASH_DISTANCE = 10     # differing bits (of 64) for a proof to count as a new picture
+# Proof encodings, best first: (width, height, JPEG quality)
+PROOF_LEVELS = [(640, 360, 85), (480, 270, 75), (320, 180, 60)]
+SLOW_UPLOAD_SECS = 1.5       # step down a level after an upload slower than this
+FAST_UPLOAD_SECS = 0.4       # step back up after one faster than this
+
+def rejected(r):
+    """ A 4xx the server will give again on replay (bad event): not 404 (old server) nor 408/429 """
+    return 400 <= r.status_code < 500 and r.status_code not in (404, 408, 429)
+
+def frame_hash(frame):
+    """ 64-bit difference hash: which neighbouring pixels of a 9x8 gray thumbnail get brighter.
+        Robust to noise, JPEG and small exposure changes; a moved head flips many bits. """
+    small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+def hash_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class StatusReporter:
+    """ Buffers status events and sends them in order through one keep-alive session.
+        Events that fail (offline, server error) stay queued and are replayed in order;
+        events the server rejects (4xx) are logged, counted and dropped.
+
+        report() only forwards changes: a repeated state is dropped (a heartbeat every
+        HEARTBEAT_SECS keeps the server's timer honest) and a proof frame is dropped when its
+        perceptual hash matches the last uploaded one. Proofs shrink when uploads are slow. """
+    def __init__(self, server_url, code, flush_delay=0.3, max_queue=500):
+        self.url = server_url.rstrip("/")
+        self.code = code
+        self.flush_delay = flush_delay   # short window so bursts go out as one request
+        self.max_queue = max_queue
+        self.events = deque()
+        self.proof = None                # (event, frame) of the newest distracted frame
+        self.session = requests.Session()
+        self.batch_supported = True
+        self.cond = threading.Condition()
+        self.closed = False
+        self.backoff = 0
+        self.last_event = None           # newest event queued, and when, for the heartbeat
+        self.last_event_at = 0
+        self.proof_hash = None
+        self.level = 0                   # index into PROOF_LEVELS
+        self.counters = {"events": 0, "events_skipped": 0, "heartbeats": 0,
+                         "events_rejected": 0, "proofs": 0, "proofs_skipped": 0, "proof_bytes": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _state(event):
+        return event.get("is_distracted"), event.get("reason"), event.get("session_id")
+
+    def report(self, event, frame=None):
+        """ push() for periodic callers: returns False when nothing worth sending changed """
+        with self.cond:
+            changed = self.last_event is None or self._state(event) != self._state(self.last_event)
+            if frame is not None:
+                h = frame_hash(frame)
+                if not changed and self.proof_hash is not None and hash_distance(h, self.proof_hash) < PROOF_HASH_DISTANCE:
+                    frame = None
+                    self.counters["proofs_skipped"] += 1
+                else:
+                    self.proof_hash = h
+            if not changed and frame is None:
+                self.counters["events_skipped"] += 1
+                return False
+        self.push(event, frame)
+        return True
+
+    def push(self, event, frame=None):
+        # When it happened (epoch): replays after an offline stretch keep their own times
+        event = dict(event, ts=event.get("ts", time.time()))
+        with self.cond:
+            self.last_event, self.last_event_at = event, time.time()
+            self.counters["events"] += 1
+            self.events.append(event)
+            if len(self.events) > self.max_queue:
+                self.events.popleft()  # long offline stretch: oldest transitions matter least
+            if frame is not None:
+                self.proof = (event, frame)
+            self.cond.notify()
+
+    def close(self, timeout=3):
+        """ Flushes what is queued (best effort) and stops the sender """
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.events and not self.closed:
+                    if self.last_event is None or self.last_event.get("reason") == "Stopped":
+                        self.cond.wait()  # nothing to keep alive until the next push
+                    else:
+                        self.cond.wait(max(self.last_event_at + HEARTBEAT_SECS - time.time(), 0.1))
+                    self._heartbeat()
+                if not self.events: return
+            if not self.closed: time.sleep(self.flush_delay)
+            with self.cond:
+                batch = list(self.events)
+                proof = self.proof if self.proof and any(e is self.proof[0] for e in batch) else None
+            if self._send(batch, proof):
+                sent = {id(e) for e in batch}
+                with self.cond:
+                    while self.events and id(self.events[0]) in sent:
+                        self.events.popleft()
+                    if self.proof is proof: self.proof = None
+                self.backoff = 0
+            elif self.closed:
+                return
+            else:
+                self.backoff = min(max(self.backoff * 2, 1), 30)
+                time.sleep(self.backoff)
+
+    def _heartbeat(self):
+        """ Called with cond held: re-queues the last state with the timer advanced """
+        last = self.last_event
+        if self.events or last is None or last.get("reason") == "Stopped": return
+        now = time.time()
+        if now - self.last_event_at < HEARTBEAT_SECS: return
+        beat = dict(last, seconds=last.get("seconds", 0) + int(now - self.last_event_at),
+                    timestamp=time.strftime("%H:%M:%S"), ts=now)
+        self.last_event, self.last_event_at = beat, now
+        self.counters["heartbeats"] += 1
+        self.events.append(beat)
+
+    def stats(self):
+        width, _, quality = PROOF_LEVELS[self.level]
+        return dict(self.counters, proof_width=width, proof_quality=quality)
+
+    def _adapt(self, seconds):
+        """ Picks the proof encoding from how long the last upload with a proof took """
+        if seconds > SLOW_UPLOAD_SECS and self.level < len(PROOF_LEVELS) - 1:
+            self.level += 1
+        elif seconds < FAST_UPLOAD_SECS and self.level > 0:
+            self.level -= 1
+
+    def _send(self, batch, proof):
+        payload = [dict(e, proof=True) if proof and e is proof[0] else e for e in batch]
+        files = None
+        if proof is not None:
+            # Resize to make upload faster
+            width, height, quality = PROOF_LEVELS[self.level]
+            _, img_encoded = cv2.imencode('.jpg', cv2.resize(proof[1], (width, height)), [cv2.IMWRITE_JPEG_QUALITY, quality])
+            files = {'image': ('image.jpg', img_encoded.tobytes(), 'image/jpeg')}
+        started = time.time()
+        ok = self._post(payload, files)
+        if ok and files:
+            self._adapt(time.time() - started)
+            self.counters["proofs"] += 1
+            self.counters["proof_bytes"] += len(files['image'][1])
+        return ok
+
+    def _post(self, payload, files):
+        try:
+            if not self.batch_supported:
+                return self._send_each(payload, files)
+            # sent_at lets the server correct event times for this machine's clock
+            body = {"code": self.code, "events": payload, "sent_at": time.time()}
+            if files:
+                r = self.session.post(f"{self.url}/update_status/batch", data={"events": json.dumps(body)}, files=files, timeout=10)
+            else:
+                r = self.session.post(f"{self.url}/update_status/batch", json=body, timeout=10)
+            if r.status_code == 404:  # older server without the batch route
+                self.batch_supported = False
+                return self._send_each(payload, files)
+            if rejected(r) and len(payload) > 1:
+                # The server applies a batch all or nothing: resend one by one so only the bad
+                # event is dropped (one that fails transiently here makes the batch go again)
+                return all([self._post([e], files if e.get("proof") else None) for e in payload])
+            if rejected(r):
+                self._reject(payload[0], r)
+                return True
+            return r.ok
+        except requests.RequestException:
+            return False
+
+    def _reject(self, event, r):
+        print(f"Status event rejected ({r.status_code} {r.text[:200]}): {event}")
+        self.counters["events_rejected"] += 1
+
+    def _send_each(self, payload, files):
+        for e in payload:
+            data = {k: v for k, v in e.items() if k != "proof"}
+            data["code"] = self.code
+            data["is_distracted"] = "True" if e.get("is_distracted") else "False"
+            data["sent_at"] = time.time()
+            r = self.session.post(f"{self.url}/update_status", data=data, files=files if e.get("proof") else None, timeout=10)
+            if rejected(r): self._reject(e, r)
+            elif not r.ok: return False
+        return True
@@ -0,0 +1,63 @@
+import os
+import json
+import sqlite3
+import hashlib
+
+class TrainingManifest:
+    """ What process_training has already ingested, plus a cache of extracted words.
+
+        files: path -> (size, mtime, sha1, ingested). A file is skipped when its size and
+               mtime are unchanged, or when they changed but the content hash did not.
+        words: sha1 -> extracted tags / words (JSON), so rebuilding the graph (e.g. after a
+               vocabulary change) never decodes or runs detection on an image again.
+
+        Changes are only committed by checkpoint(), right after the brain itself has been
+        saved, so an interrupted run resumes from its last checkpoint. """
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sha1 TEXT, ingested INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS words (sha1 TEXT PRIMARY KEY, words TEXT)")
+        self.conn.commit()
+
+    @staticmethod
+    def file_hash(path):
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def pending(self, path):
+        """ Returns (needs_ingest, sha1) for a file, updating its stat record """
+        st = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime, sha1, ingested FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[3] and row[0] == st.st_size and row[1] == st.st_mtime:
+            return False, row[2]
+        sha1 = self.file_hash(path)
+        if row and row[3] and row[2] == sha1:
+            self.conn.execute("UPDATE files SET size = ?, mtime = ? WHERE path = ?", (st.st_size, st.st_mtime, path))
+            return False, sha1
+        self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, 0)", (path, st.st_size, st.st_mtime, sha1))
+        return True, sha1
+
+    def cached_words(self, sha1):
+        """ (True, words) if this content was extracted before; words may be None (unreadable) """
+        row = self.conn.execute("SELECT words FROM words WHERE sha1 = ?", (sha1,)).fetchone()
+        return (True, json.loads(row[0])) if row else (False, None)
+
+    def store_words(self, sha1, words):
+        self.conn.execute("INSERT OR REPLACE INTO words VALUES (?, ?)", (sha1, json.dumps(words)))
+
+    def mark_ingested(self, path):
+        self.conn.execute("UPDATE files SET ingested = 1 WHERE path = ?", (path,))
+
+    def reset_ingested(self):
+        """ Forget what the graph contains but keep the words cache (full rebuild) """
+        self.conn.execute("UPDATE files SET ingested = 0")
+
+    def checkpoint(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
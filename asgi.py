@@ -0,0 +1,225 @@
+"""ASGI entry point: the same routes and JSON contracts as server.py, for async workers.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+The long-lived requests (/status/<code>?since= long-polls, /status/<code>/stream and
+/admin/live-rooms/stream) are served on the event loop: a waiting client is a parked
+future, not a thread, so one process holds hundreds of them. Every other route runs the
+Flask view unchanged in a bounded thread pool (BLOCKING_THREADS), since firebase_admin,
+SQLite and the proof writes are blocking.
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+import tempfile
+from urllib.parse import parse_qsl
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+import metrics
+
+BLOCKING_THREADS = int(os.getenv("BLOCKING_THREADS", 32))
+MAX_BODY = 16 * 1024 * 1024
+SPOOL_BODY_BYTES = 256 * 1024  # request bodies past this wait on disk, not in memory
+
+executor = ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix="blocking")
+
+STATUS_PATH = re.compile(r"^/status/([^/]+)$")
+STATUS_STREAM_PATH = re.compile(r"^/status/([^/]+)/stream$")
+ROOMS_STREAM_PATH = "/admin/live-rooms/stream"
+
+async def blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+def host_url(scope, headers):
+    host = headers.get("host") or "%s:%s" % tuple(scope.get("server") or ("localhost", 80))
+    return f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}/"
+
+def response_headers(content_type, extra=()):
+    # Same CORS answer as flask_cors gives the WSGI routes
+    return [(b"content-type", content_type.encode()), (b"access-control-allow-origin", b"*")] + [
+        (k.encode(), v.encode()) for k, v in extra]
+
+async def send_json(send, status, obj):
+    body = (server.app.json.dumps(obj, separators=(",", ":")) + "\n").encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": response_headers("application/json") + [(b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def send_stream(send, receive, events):
+    """Streams an async generator of SSE strings until it ends or the client goes away"""
+    await send({"type": "http.response.start", "status": 200, "headers": response_headers(
+        "text/event-stream; charset=utf-8", [("cache-control", "no-cache"), ("x-accel-buffering", "no")])})
+
+    async def pump():
+        async for chunk in events:
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in tasks: t.cancel()
+
+# --- NATIVE ROUTES (mirror server.get_status / stream_status / stream_live_rooms) ---
+
+async def status_long_poll(send, code, since, wait, base_url):
+    await server.registry_watcher.wait_async(since, wait, code)
+    data = await blocking(server.device_registry.get, code, server.OFFLINE_DEVICE)
+    await send_json(send, 200, server.status_payload(code, data, base_url))
+
+async def status_events(code, version, base_url):
+    stale = False
+    while True:
+        current = await server.registry_watcher.wait_async(version, server.STREAM_TICK_SECS, code)
+        data = await blocking(server.device_registry.get, code, server.OFFLINE_DEVICE)
+        was_stale, stale = stale, server.is_stale(data)
+        if current > version or stale != was_stale:
+            version = max(current, version)
+            yield server.sse("status", server.status_payload(code, data, base_url), version)
+        else:
+            yield server.sse("tick", {"seconds": server.live_seconds(data), "version": version})
+
+async def room_events(version):
+    offline = set()
+    while True:
+        current = await server.registry_watcher.wait_async(version, server.STREAM_TICK_SECS)
+        rooms = await blocking(server.live_rooms)
+        was_offline, offline = offline, server.offline_rooms(rooms)
+        if current > version or offline != was_offline:
+            version = max(current, version)
+            yield server.sse("rooms", rooms, version)
+        else:
+            yield ": keep-alive\n\n"
+
+def record(route, started):
+    # Like the Flask routes: handler time, up to the first byte for streams
+    metrics.observe("focus_http_request_duration_seconds", time.perf_counter() - started,
+                    route=route, method="GET", status="200")
+
+async def native(scope, receive, send, headers):
+    """Serves the request if it is one of the long-lived routes; returns False otherwise"""
+    if scope["method"] != "GET": return False
+    started = time.perf_counter()
+    path = scope["path"]
+    query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    poll, stream = STATUS_PATH.match(path), STATUS_STREAM_PATH.match(path)
+    if poll and query.get("since") is not None: route = "/status/<code>"
+    elif stream: route = "/status/<code>/stream"
+    elif path == ROOMS_STREAM_PATH: route = ROOMS_STREAM_PATH
+    else: return False
+    try:
+        if poll:
+            since, wait = server.parse_since(None, query["since"]), server.parse_wait(query.get("wait"))
+        else:
+            since = server.parse_since(headers.get("last-event-id"), query.get("since"))
+    except ValueError:
+        await send_json(send, 400, server.BAD_STREAM_PARAMS)
+        return True
+    if poll:
+        await status_long_poll(send, poll.group(1), since, wait, host_url(scope, headers))
+        record(route, started)
+    elif stream:
+        record(route, started)
+        await send_stream(send, receive, status_events(stream.group(1), since, host_url(scope, headers)))
+    else:
+        record(route, started)
+        await send_stream(send, receive, room_events(since))
+    return True
+
+# --- EVERYTHING ELSE: the Flask app over a minimal WSGI bridge ---
+
+def build_environ(scope, headers, body):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name, "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0), "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body, "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True, "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }
+    for name, value in headers.items():
+        if name == "content-type": environ["CONTENT_TYPE"] = value
+        elif name == "content-length": environ["CONTENT_LENGTH"] = value
+        else: environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return environ
+
+async def read_body(receive, body):
+    """Copies the request body into the file body, rewound: None on disconnect, False past MAX_BODY"""
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect": return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY: return False
+        if size > SPOOL_BODY_BYTES: await blocking(body.write, chunk)  # on disk by now
+        else: body.write(chunk)
+        if not message.get("more_body"):
+            body.seek(0)
+            return True
+
+async def run_wsgi(scope, receive, send, headers):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BODY_BYTES) as body:
+        complete = await read_body(receive, body)
+        if complete is None: return
+        if complete is False:
+            await send_json(send, 413, {"error": "Request too large"})
+            return
+        await call_wsgi(scope, send, headers, body)
+
+async def call_wsgi(scope, send, headers, body):
+    started = {}
+    def start_response(status, response_headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]
+        return lambda data: started.setdefault("written", []).append(data)
+
+    def call():
+        result = server.app(build_environ(scope, headers, body), start_response)
+        return result, iter(result)
+
+    result, chunks = await blocking(call)
+    try:
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        for data in started.get("written", []):
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+        while True:
+            # send_file and other iterables are read in the pool, a chunk at a time
+            data = await blocking(next, chunks, None)
+            if data is None: break
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(result, "close"): await blocking(result.close)
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http": return
+
+    headers = {}
+    for k, v in scope.get("headers", []):
+        k, v = k.decode("latin-1").lower(), v.decode("latin-1")
+        headers[k] = f"{headers[k]},{v}" if k in headers else v
+    if not await native(scope, receive, send, headers):
+        await run_wsgi(scope, receive, send, headers)  # timed by server.py's request hooks
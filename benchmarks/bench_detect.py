@@ -0,0 +1,93 @@
+"""Compares CrystalEngine's full-frame detection with the tracking mode, per detector backend.
+
+Each JPEG in proofs/ is replayed as a short "video" (the same frame, lightly jittered,
+REPEAT times) so the tracker has temporal coherence to exploit. Accuracy is the share of
+frames whose tags match the Haar full-frame path on the same input; every backend is
+scored against that one reference, on the same clips, so the numbers are comparable.
+
+    python benchmarks/bench_detect.py [--images proofs] [--repeat 30] [--backends haar,yunet] [--out bench.json]
+
+The top-level full_frame / tracking / speedup entries are Haar's; other backends are under
+"backends", with speedup relative to Haar full-frame.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+
+import numpy as np # type: ignore
+import cv2 # type: ignore
+
+from common import ROOT, summarize
+from crystal_engine import CrystalEngine
+from detectors import BACKENDS
+
+def load_clips(image_dir, repeat, seed=0):
+    rng = np.random.default_rng(seed)
+    clips = []
+    for path in sorted(glob.glob(os.path.join(image_dir, "*.jpg"))):
+        img = cv2.imread(path)
+        if img is None: continue
+        frames = []
+        for _ in range(repeat):
+            # Small camera shake so consecutive frames are not bit-identical
+            dx, dy = rng.integers(-4, 5, size=2)
+            m = np.float32([[1, 0, dx], [0, 1, dy]])
+            frames.append(cv2.warpAffine(img, m, (img.shape[1], img.shape[0]), borderMode=cv2.BORDER_REPLICATE))
+        clips.append((os.path.basename(path), frames))
+    return clips
+
+def run(engine, clips, reference=None):
+    latencies, outputs = [], []
+    for _, frames in clips:
+        if engine.tracker is not None: engine.tracker.reset()
+        for frame in frames:
+            t = time.perf_counter()
+            outputs.append(engine._extract_features(frame))
+            latencies.append(time.perf_counter() - t)
+    result = summarize(latencies)
+    if reference is not None:
+        agree = sum(1 for a, b in zip(outputs, reference) if a == b)
+        result["tag_agreement"] = round(agree / len(outputs), 4) if outputs else 1.0
+    if engine.tracker is not None:
+        result["schedule"] = dict(engine.tracker.stats)
+    return result, outputs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default=os.path.join(ROOT, "proofs"))
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    clips = load_clips(args.images, args.repeat)
+    if not clips:
+        sys.exit(f"No JPEGs found in {args.images}")
+    baseline, reference = run(CrystalEngine(detector="haar"), clips)
+    speedup = lambda r: round(r["per_sec"] / baseline["per_sec"], 2) if baseline["per_sec"] else None
+    tracked, _ = run(CrystalEngine(tracking=True, detector="haar"), clips, reference)
+    report = {
+        "images": len(clips), "repeat": args.repeat,
+        "full_frame": baseline, "tracking": tracked, "speedup": speedup(tracked), "backends": {},
+    }
+    for name in args.backends.split(","):
+        if name == "haar": continue
+        engine = CrystalEngine(detector=name)
+        if engine.detector.name != name:
+            report["backends"][name] = {"error": "unavailable, see the log above"}
+            continue
+        full, _ = run(engine, clips, reference)
+        tracked, _ = run(CrystalEngine(tracking=True, detector=name), clips, reference)
+        report["backends"][name] = {"full_frame": full, "tracking": tracked,
+                                    "speedup": speedup(full), "tracking_speedup": speedup(tracked)}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(text)
+    print(text)
+    return report
+
+if __name__ == "__main__":
+    main()
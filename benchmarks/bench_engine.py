@@ -0,0 +1,94 @@
+"""CrystalEngine benchmarks: feature extraction on proofs/, training and saving on a
+synthetic corpus.
+
+    python benchmarks/bench_engine.py [--docs 2000] [--out engine.json]
+"""
+import os
+import json
+import glob
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import cv2 # type: ignore
+
+from common import ROOT, measure
+from crystal_engine import CrystalEngine
+
+def bench_extract(image_dir, iterations):
+    images = [cv2.imread(p) for p in sorted(glob.glob(os.path.join(image_dir, "*.jpg")))]
+    images = [img for img in images if img is not None]
+    if not images: return {"error": f"no JPEGs in {image_dir}"}
+    engine = CrystalEngine()
+    result = {"images": len(images)}
+    result["extract_features"] = measure(lambda i: engine._extract_features(images[i % len(images)]), iterations)
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+    result["extract_features_path"] = measure(lambda i: engine._extract_features(paths[i % len(paths)]), iterations)
+    return result
+
+def make_corpus(path, docs, vocab, words_per_doc, images, image_dir, seed=0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocab)]
+    domains = ["focus", "distract", "sleep", "phone"]
+    for i in range(docs):
+        with open(os.path.join(path, f"{domains[i % len(domains)]}_{i}.txt"), "w") as f:
+            f.write(" ".join(rng.choice(words) for _ in range(words_per_doc)))
+    sources = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+    for i in range(images if sources else 0):
+        shutil.copy(sources[i % len(sources)], os.path.join(path, f"{domains[i % len(domains)]}_img{i}.jpg"))
+
+def timed(fn):
+    t = time.perf_counter()
+    out = fn()
+    return round(time.perf_counter() - t, 4), out
+
+def bench_training(docs, vocab, words_per_doc, images, image_dir, workers):
+    result = {"docs": docs, "vocab": vocab, "words_per_doc": words_per_doc, "images": images}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus")
+        os.makedirs(corpus)
+        make_corpus(corpus, docs, vocab, words_per_doc, images, image_dir)
+        os.chdir(tmp)  # save_all writes ./Brain
+        try:
+            noop = lambda *a: None
+            engine = CrystalEngine()
+            result["process_training_s"], _ = timed(lambda: engine.process_training(corpus, noop, workers=workers))
+            result["vertices"], result["edges"] = len(engine.vertices), len(engine.edges)
+            result["process_training_rerun_s"], _ = timed(lambda: CrystalEngine().process_training(corpus, noop))
+            result["process_training_rebuild_s"], _ = timed(lambda: CrystalEngine().process_training(corpus, noop, rebuild=True))
+            result["save_all_s"], _ = timed(lambda: engine.save_all(map_format=None))
+            if os.path.exists(os.path.join("Brain", "knowledge_map.obj.state")): os.remove(os.path.join("Brain", "knowledge_map.obj.state"))
+            result["export_obj_full_s"], _ = timed(lambda: engine.export_to_obj(os.path.join("Brain", "knowledge_map.obj")))
+            result["export_ply_s"], _ = timed(lambda: engine.export_to_ply(os.path.join("Brain", "knowledge_map.ply")))
+            result["load_brain_s"], _ = timed(lambda: CrystalEngine().load_brain(os.path.join("Brain", "crystal_brain.pb")))
+        finally:
+            os.chdir(cwd)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default=os.path.join(ROOT, "proofs"))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--vocab", type=int, default=5000)
+    parser.add_argument("--words-per-doc", type=int, default=200)
+    parser.add_argument("--train-images", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    report = {
+        "extract": bench_extract(args.images, args.iterations),
+        "training": bench_training(args.docs, args.vocab, args.words_per_doc, args.train_images, args.images, args.workers),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(text)
+    print(text)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Server hot-endpoint benchmarks through Flask's test client, with Firebase and SePay
+replaced by in-memory fakes (benchmarks/fakes.py) and all local state in a temp dir.
+
+    python benchmarks/bench_server.py [--iterations 500] [--out server.json]
+"""
+import os
+import io
+import glob
+import json
+import random
+import argparse
+import tempfile
+
+from common import ROOT, measure
+from fakes import FakeDB, FakeSePay
+
+def load_server(tmp):
+    """Imports server.py against the fakes; must run before anything else imports it"""
+    # Empty values win over .env (load_dotenv never overrides): no poller, no mail sender,
+    # and rate limits out of the way: the load comes from one client address
+    os.environ.update(DATA_DIR=tmp, SEPAY_API_KEY="", SEPAY_WEBHOOK_KEY="", SENDER_EMAIL="",
+                      DEVICE_REGISTRY=os.environ.get("DEVICE_REGISTRY", "sqlite"),
+                      PAYMENT_IP_RATE="1e9", PAYMENT_IP_BURST="1000000", PAYMENT_NOTE_RATE="1e9", PAYMENT_NOTE_BURST="1000000")
+    import server
+    import metrics
+    import proof_store
+    server.db = metrics.InstrumentedDB(FakeDB())
+    proof_store.BLOB_DIR = os.path.join(tmp, "blobs")
+    return server
+
+def seed(server, client, sales, paid_ratio=0.8):
+    """sales transactions through /confirm_transaction; paid ones settled via the webhook"""
+    sepay = FakeSePay()
+    notes, keys = [], []
+    for i in range(sales):
+        note = client.get('/generate_transaction_note?plan=PRO').get_json()['transaction_note']
+        client.post('/confirm_transaction', json={"transaction_note": note, "email": f"user{i}@example.com"})
+        notes.append(note)
+        if i < sales * paid_ratio:
+            sepay.pay(note, 315000)
+    server.sepay_index.ingest_api_transactions(sepay.fetch(len(sepay.rows)))
+    for note in notes[:int(sales * paid_ratio)]:
+        client.post('/check_payment_status', json={"transaction_note": note})
+    keys = [server.db.reference(f'transactions/{n}/license_key').get() for n in notes[:int(sales * paid_ratio)]]
+    return notes, keys
+
+def bench(iterations, sales, rooms, image_dir):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = load_server(tmp)
+        server.send_license_email = lambda *a: None
+        client = server.app.test_client()
+        notes, keys = seed(server, client, sales)
+        images = [open(p, "rb").read() for p in sorted(glob.glob(os.path.join(image_dir, "*.jpg")))]
+        codes = [f"ROOM{i:04d}" for i in range(rooms)]
+        result = {"sales": sales, "rooms": rooms, "registry": os.environ["DEVICE_REGISTRY"]}
+
+        def update(i, with_image=False):
+            data = {"code": codes[i % rooms], "is_distracted": "true" if with_image else "false",
+                    "reason": "Phone" if with_image else "Focusing", "session_id": "1", "seconds": str(i)}
+            if with_image: data["image"] = (io.BytesIO(images[i % len(images)]), "proof.jpg")
+            client.post('/update_status', data=data, content_type="multipart/form-data")
+
+        result["update_status"] = measure(update, iterations)
+        if images:
+            result["update_status_image"] = measure(lambda i: update(i, True), max(iterations // 10, 10))
+        result["status"] = measure(lambda i: client.get(f'/status/{codes[i % rooms]}'), iterations)
+        result["verify_license_hit"] = measure(lambda i: client.post('/verify_license', json={"license_key": rng.choice(keys)}), iterations)
+        result["verify_license_miss"] = measure(lambda i: client.post('/verify_license', json={"license_key": f"GF-UNKNOWN{i}"}), iterations)
+        result["check_payment_pending"] = measure(lambda i: client.post('/check_payment_status', json={"transaction_note": notes[-1 - i % max(sales // 5, 1)]}), iterations)
+        result["admin_ledger"] = measure(lambda i: client.get('/admin/ledger?limit=50'), iterations)
+        etag = client.get('/admin/ledger?limit=50').headers.get('ETag')
+        result["admin_ledger_304"] = measure(lambda i: client.get('/admin/ledger?limit=50', headers={"If-None-Match": etag}), iterations)
+        result["live_rooms"] = measure(lambda i: client.get('/admin/live-rooms'), iterations)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--sales", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--images", default=os.path.join(ROOT, "proofs"))
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    report = bench(args.iterations, args.sales, args.rooms, args.images)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(text)
+    print(text)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Timing helpers shared by the benchmark scripts."""
+import os
+import sys
+import time
+import subprocess
+
+import numpy as np # type: ignore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "Src")
+for p in (ROOT, SRC):
+    if p not in sys.path: sys.path.insert(0, p)
+
+def summarize(latencies):
+    """Throughput and latency percentiles (ms) for a list of per-call durations (s)"""
+    total = sum(latencies)
+    ms = lambda q: round(float(np.percentile(latencies, q)) * 1000, 3) if latencies else 0.0
+    return {
+        "calls": len(latencies),
+        "per_sec": round(len(latencies) / total, 2) if total else 0.0,
+        "p50_ms": ms(50), "p95_ms": ms(95), "p99_ms": ms(99), "max_ms": ms(100),
+    }
+
+def measure(fn, iterations, warmup=3):
+    """Calls fn(i) iterations times (after warmup calls) and summarizes the timings"""
+    for i in range(warmup): fn(i)
+    latencies = []
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies)
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,88 @@
+"""In-memory stand-ins for the server's outside services, for offline benchmarks.
+
+FakeDB mimics the part of firebase_admin.db the server uses: reference(path) with
+get / set / update / delete and order_by_child(...).start_at / end_at / equal_to /
+limit_to_first / limit_to_last queries.
+"""
+import copy
+
+class FakeQuery:
+    def __init__(self, ref, child):
+        self.ref, self.child = ref, child
+        self.start = self.end = self.equal = None
+        self.first = self.last = None
+
+    def start_at(self, v): self.start = v; return self
+    def end_at(self, v): self.end = v; return self
+    def equal_to(self, v): self.equal = v; return self
+    def limit_to_first(self, n): self.first = n; return self
+    def limit_to_last(self, n): self.last = n; return self
+
+    def get(self):
+        node = self.ref.get() or {}
+        rows = [(k, v) for k, v in node.items() if isinstance(v, dict) and self.child in v]
+        if self.equal is not None: rows = [r for r in rows if r[1][self.child] == self.equal]
+        if self.start is not None: rows = [r for r in rows if r[1][self.child] >= self.start]
+        if self.end is not None: rows = [r for r in rows if r[1][self.child] <= self.end]
+        rows.sort(key=lambda r: r[1][self.child])
+        if self.first is not None: rows = rows[:self.first]
+        if self.last is not None: rows = rows[-self.last:]
+        return dict(rows)
+
+class FakeRef:
+    def __init__(self, db, path):
+        self.db = db
+        self.parts = [p for p in path.strip("/").split("/") if p]
+
+    def _parent(self, create):
+        node = self.db.root
+        for p in self.parts[:-1]:
+            if p not in node:
+                if not create: return None
+                node[p] = {}
+            node = node[p]
+        return node
+
+    def get(self):
+        if not self.parts: return copy.deepcopy(self.db.root)
+        parent = self._parent(False)
+        return copy.deepcopy(parent.get(self.parts[-1])) if parent else None
+
+    def set(self, value):
+        self._parent(True)[self.parts[-1]] = copy.deepcopy(value)
+
+    def update(self, fields):
+        parent = self._parent(True)
+        node = parent.setdefault(self.parts[-1], {}) if self.parts else self.db.root
+        for k, v in fields.items():
+            node[k] = copy.deepcopy(v)
+
+    def delete(self):
+        parent = self._parent(False)
+        if parent: parent.pop(self.parts[-1], None)
+
+    def order_by_child(self, child):
+        return FakeQuery(self, child)
+
+class FakeDB:
+    """Drop-in for the firebase_admin.db module: server.db = FakeDB()"""
+    def __init__(self):
+        self.root = {}
+
+    def reference(self, path="/"):
+        return FakeRef(self, path)
+
+class FakeSePay:
+    """Stands in for SePay's userapi transactions/list: fetch(limit) -> newest rows first"""
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+
+    def pay(self, note, amount, ref=None):
+        ref = ref if ref is not None else len(self.rows) + 1
+        self.rows.insert(0, {"id": ref, "transaction_content": f"CT DEN {note} FT{ref:08d}",
+                             "amount_in": str(amount), "transaction_date": "2026-01-01 10:00:00"})
+
+    def fetch(self, limit=50):
+        self.calls += 1
+        return self.rows[:limit]
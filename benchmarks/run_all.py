@@ -0,0 +1,80 @@
+"""Runs every benchmark and writes one JSON report tagged with the git revision, so runs
+from different commits can be compared.
+
+    python benchmarks/run_all.py [--only engine,server,detect] [--quick] [--out bench-<rev>.json]
+    python benchmarks/run_all.py --compare bench-old.json [--threshold 0.1]
+
+--compare flags every p50/p95 latency or stage time (…_s) that grew, and every per_sec /
+speedup that shrank, by more than --threshold against the old report; the exit status is
+1 if any did. p99 and max are reported by the suites but too noisy to gate on.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+
+from common import git_revision
+import bench_detect
+import bench_engine
+import bench_server
+
+SUITES = {
+    "engine": (bench_engine.main, [], ["--docs", "300", "--iterations", "10", "--train-images", "4"]),
+    "server": (bench_server.main, [], ["--iterations", "100", "--sales", "200"]),
+    "detect": (bench_detect.main, [], ["--repeat", "10"]),
+}
+HIGHER_IS_BETTER = ("per_sec", "speedup")
+LOWER_IS_BETTER = ("p50_ms", "p95_ms")
+
+def flatten(report, prefix=""):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+def compare(old, new, threshold):
+    """(metric, old, new, change) for each regression beyond threshold"""
+    old_metrics = dict(flatten(old.get("results", {})))
+    regressions = []
+    for name, value in flatten(new.get("results", {})):
+        base = old_metrics.get(name)
+        leaf = name.rsplit(".", 1)[-1]
+        if not base or not (leaf.endswith("_s") or leaf in LOWER_IS_BETTER + HIGHER_IS_BETTER): continue
+        change = (value - base) / base
+        if (-change if leaf in HIGHER_IS_BETTER else change) > threshold:
+            regressions.append((name, base, value, round(change, 3)))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default=",".join(SUITES))
+    parser.add_argument("--quick", action="store_true", help="small inputs, for a smoke run")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="older run_all report to diff against")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    report = {"revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "machine": platform.machine(), "results": {}}
+    for name in args.only.split(","):
+        fn, full, quick = SUITES[name]
+        print(f"--- {name}", file=sys.stderr)
+        report["results"][name] = fn(quick if args.quick else full)
+
+    out = args.out or f"bench-{report['revision'] or 'local'}.json"
+    with open(out, "w") as f: json.dump(report, f, indent=2)
+    print(f"Report written to {out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f: old = json.load(f)
+        regressions = compare(old, report, args.threshold)
+        print(f"\nvs {old.get('revision')}: {len(regressions)} regression(s) over {args.threshold:.0%}")
+        for name, base, value, change in regressions:
+            print(f"  {name}: {base} -> {value} ({change:+.1%})")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
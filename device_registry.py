@@ -0,0 +1,289 @@
+"""Device state shared by every gunicorn worker.
+
+The registry behaves like the old per-process dict (get / [] / items) but can be
+backed by process memory, a SQLite WAL file on the host, or Redis. Entries that
+have not been written for DEVICE_TTL seconds are treated as gone.
+
+Every write stamps the entry with the next value of a registry-wide sequence
+("version"), so watchers can ask for whatever changed since the version they saw.
+
+Pick the backend with DEVICE_REGISTRY: "memory", "sqlite" (default) or a
+redis:// URL.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+
+import metrics
+import local_db
+
+try:
+    import redis # type: ignore
+except ImportError:
+    redis = None
+
+DEVICE_TTL = int(os.getenv("DEVICE_TTL", 12 * 3600))
+
+class MemoryRegistry:
+    """Single-process registry; only correct with one worker"""
+    def __init__(self, ttl=DEVICE_TTL):
+        self.ttl = ttl
+        self._data = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def get(self, code, default=None):
+        with self._lock:
+            hit = self._data.get(code)
+        if hit and hit[0] > time.time() - self.ttl:
+            return hit[1]
+        return default
+
+    def _write(self, code, info):
+        self._seq += 1
+        info["version"] = self._seq
+        self._data[code] = (time.time(), info)
+        return info
+
+    def __setitem__(self, code, info):
+        with self._lock:
+            self._write(code, dict(info))
+
+    def update(self, code, fields):
+        """Merges fields into the entry atomically and returns the new entry"""
+        with self._lock:
+            hit = self._data.get(code)
+            info = dict(hit[1]) if hit and hit[0] > time.time() - self.ttl else {}
+            info.update(fields)
+            return self._write(code, info)
+
+    def items(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for code in [c for c, (t, _) in self._data.items() if t <= cutoff]:
+                del self._data[code]
+            return [(c, info) for c, (_, info) in self._data.items()]
+
+    def __len__(self):
+        return len(self.items())
+
+    def version(self):
+        return self._seq
+
+    def changes_since(self, version):
+        with self._lock:
+            return [(c, info) for c, (_, info) in self._data.items() if info["version"] > version]
+
+class SqliteRegistry:
+    """Registry in a WAL-mode SQLite file, shared by all workers on one host"""
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS devices (code TEXT PRIMARY KEY, info TEXT, updated REAL, version INTEGER);
+    CREATE INDEX IF NOT EXISTS devices_updated ON devices (updated);
+    CREATE INDEX IF NOT EXISTS devices_version ON devices (version);
+    CREATE TABLE IF NOT EXISTS seq (id INTEGER PRIMARY KEY CHECK (id = 0), v INTEGER);
+    INSERT OR IGNORE INTO seq VALUES (0, 0);
+    """
+
+    def __init__(self, path=None, ttl=DEVICE_TTL):
+        self._db = local_db.connector(path or "devices.db", self.SCHEMA, autocommit=True)
+        self.path = self._db.path
+        self.ttl = ttl
+        self._last_sweep = 0
+
+    def get(self, code, default=None):
+        row = self._db().execute("SELECT info FROM devices WHERE code = ? AND updated > ?",
+                                 (code, time.time() - self.ttl)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _write(self, code, fields, merge):
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            info = self.get(code, {}) if merge else {}
+            info.update(fields)
+            conn.execute("UPDATE seq SET v = v + 1")
+            info["version"] = conn.execute("SELECT v FROM seq").fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?)",
+                         (code, json.dumps(info), time.time(), info["version"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._sweep()
+        return info
+
+    def __setitem__(self, code, info):
+        self._write(code, info, merge=False)
+
+    def update(self, code, fields):
+        """Merges fields into the entry atomically and returns the new entry"""
+        return self._write(code, fields, merge=True)
+
+    def items(self):
+        rows = self._db().execute("SELECT code, info FROM devices WHERE updated > ?", (time.time() - self.ttl,)).fetchall()
+        return [(code, json.loads(info)) for code, info in rows]
+
+    def __len__(self):
+        return self._db().execute("SELECT count(*) FROM devices WHERE updated > ?", (time.time() - self.ttl,)).fetchone()[0]
+
+    def version(self):
+        return self._db().execute("SELECT v FROM seq").fetchone()[0]
+
+    def changes_since(self, version):
+        rows = self._db().execute("SELECT code, info FROM devices WHERE version > ?", (version,)).fetchall()
+        return [(code, json.loads(info)) for code, info in rows]
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            self._db().execute("DELETE FROM devices WHERE updated <= ?", (now - self.ttl,))
+
+class RedisRegistry:
+    """Registry in Redis, for workers spread over several hosts"""
+    def __init__(self, url, ttl=DEVICE_TTL, prefix="gfocus:device:"):
+        if redis is None:
+            raise RuntimeError("DEVICE_REGISTRY is a redis:// URL but the 'redis' package is not installed")
+        self.r = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.index = prefix + "index"        # sorted set: code -> last write time
+        self.versions = prefix + "versions"  # sorted set: code -> version
+        self.seq = prefix + "seq"
+
+    def get(self, code, default=None):
+        raw = self.r.get(self.prefix + code)
+        return json.loads(raw) if raw else default
+
+    def _write(self, code, fields, merge):
+        key = self.prefix + code
+        result = {}
+        def write(pipe):
+            raw = pipe.get(key) if merge else None
+            info = json.loads(raw) if raw else {}
+            info.update(fields)
+            info["version"] = int(pipe.get(self.seq) or 0) + 1
+            pipe.multi()
+            pipe.set(self.seq, info["version"])
+            pipe.set(key, json.dumps(info), ex=self.ttl)
+            pipe.zadd(self.index, {code: time.time()})
+            pipe.zadd(self.versions, {code: info["version"]})
+            result["info"] = info
+        self.r.transaction(write, key, self.seq)
+        return result["info"]
+
+    def __setitem__(self, code, info):
+        self._write(code, info, merge=False)
+
+    def update(self, code, fields):
+        """Merges fields into the entry atomically (WATCH/MULTI) and returns the new entry"""
+        return self._write(code, fields, merge=True)
+
+    def _load(self, codes):
+        if not codes: return []
+        values = self.r.mget([self.prefix + c for c in codes])
+        return [(c, json.loads(v)) for c, v in zip(codes, values) if v]
+
+    def items(self):
+        expired = [c.decode() for c in self.r.zrangebyscore(self.index, "-inf", time.time() - self.ttl)]
+        if expired:
+            self.r.zrem(self.index, *expired)
+            self.r.zrem(self.versions, *expired)
+        return self._load([c.decode() for c in self.r.zrange(self.index, 0, -1)])
+
+    def __len__(self):
+        return self.r.zcount(self.index, time.time() - self.ttl, "+inf")
+
+    def version(self):
+        return int(self.r.get(self.seq) or 0)
+
+    def changes_since(self, version):
+        return self._load([c.decode() for c in self.r.zrangebyscore(self.versions, f"({version}", "+inf")])
+
+def create_registry(spec=None):
+    spec = spec or os.getenv("DEVICE_REGISTRY", "sqlite")
+    if spec == "memory":
+        return MemoryRegistry()
+    if spec.startswith("redis://") or spec.startswith("rediss://"):
+        return RedisRegistry(spec)
+    if spec.startswith("sqlite:///"):
+        return SqliteRegistry(spec[len("sqlite:///"):])
+    return SqliteRegistry()
+
+class RegistryWatcher:
+    """One thread per process follows the registry version and wakes every waiting
+    stream, so N idle watchers cost one cheap version query per interval, not N.
+    wait() parks a thread; wait_async() parks a future on the caller's event loop."""
+    def __init__(self, registry, interval=0.25):
+        self.registry = registry
+        self.interval = interval
+        self.version = 0
+        self.rooms = {}  # code -> latest entry seen by this process
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, future) woken on the next change
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid(): return
+        self._pid = os.getpid()
+        self.version = self.registry.version()
+        self.rooms = dict(self.registry.items())
+        threading.Thread(target=self._follow, daemon=True).start()
+
+    def _follow(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                current = self.registry.version()
+                if current == self.version: continue
+                changed = self.registry.changes_since(self.version)
+                with self._cond:
+                    self.rooms.update(changed)
+                    self.version = current
+                    self._cond.notify_all()
+                    waiters, self._async_waiters = self._async_waiters, []
+                for loop, fut in waiters:
+                    try:
+                        loop.call_soon_threadsafe(_wake, fut)
+                    except RuntimeError:
+                        pass  # loop already closed
+            except Exception as e:
+                print(f"Registry watcher error: {e}")
+                metrics.error("registry_watcher", e)
+
+    def wait(self, since, timeout, code=None):
+        """Blocks until the room (or any room when code is None) has a version > since,
+        or until timeout. Returns the current version for that room / the registry."""
+        self._ensure_started()
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                current = self.rooms.get(code, {}).get("version", 0) if code else self.version
+                remaining = deadline - time.time()
+                if current > since or remaining <= 0:
+                    return current
+                self._cond.wait(remaining)
+
+    async def wait_async(self, since, timeout, code=None):
+        """wait() for asyncio servers: no thread is held while the client waits"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._cond:
+                current = self.rooms.get(code, {}).get("version", 0) if code else self.version
+                remaining = deadline - loop.time()
+                if current > since or remaining <= 0:
+                    return current
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], remaining)
+            except asyncio.TimeoutError:
+                with self._cond:
+                    if waiter in self._async_waiters: self._async_waiters.remove(waiter)
+
+def _wake(fut):
+    if not fut.done(): fut.set_result(None)
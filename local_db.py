@@ -0,0 +1,54 @@
+"""Host-local SQLite stores and background jobs, shared by every gunicorn worker on a host.
+
+connector(filename, schema)      a _db() for DATA_DIR/filename: one WAL connection per
+                                 thread, reopened in forked workers, schema applied on open
+start_leader(state, lock, ...)   starts a background loop once per process; it runs only in
+                                 the worker holding DATA_DIR/<lock>, the others stand by
+"""
+import os
+import time
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: every process is the leader
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+def connector(filename, schema, autocommit=False):
+    """autocommit=True leaves transactions to the caller (BEGIN IMMEDIATE ... COMMIT)"""
+    path = os.path.join(DATA_DIR, filename)
+    local = threading.local()
+    def connect():
+        conn = getattr(local, "conn", None)
+        if conn is None or local.pid != os.getpid():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=10, isolation_level=None if autocommit else "")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(schema)
+            local.conn, local.pid = conn, os.getpid()
+        return conn
+    connect.path = path
+    return connect
+
+def _lead(lock_name, retry, loop, args):
+    lock_file = open(os.path.join(DATA_DIR, lock_name), "w")  # held for as long as loop runs
+    while True:
+        try:
+            if fcntl: fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except OSError:
+            time.sleep(retry)  # another worker is the leader
+    loop(*args)
+
+def start_leader(state, lock_name, retry, loop, *args):
+    """Runs loop(*args) in a daemon thread of this process (once: state is the module's
+    {"pid": ...} dict) after winning the host-wide lock; losers retry every retry seconds"""
+    if state["pid"] == os.getpid(): return
+    os.makedirs(DATA_DIR, exist_ok=True)
+    state["pid"] = os.getpid()
+    threading.Thread(target=_lead, args=(lock_name, retry, loop, args), daemon=True).start()
@@ -0,0 +1,135 @@
+"""Persistent outgoing mail queue.
+
+Requests only insert into a SQLite outbox. One sender thread per host (elected with a
+lock file, like the SePay poller) drains it over a single authenticated SMTP session,
+retrying failed messages with exponential backoff.
+
+SMTP_HOST / SMTP_PORT / SMTP_STARTTLS point it at another server, e.g. a local
+aiosmtpd instance: SMTP_HOST=localhost SMTP_PORT=8025 SMTP_STARTTLS=0.
+"""
+import os
+import time
+import smtplib
+import threading
+
+import metrics
+import local_db
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") not in ("0", "false", "False")
+
+BATCH_SIZE = 20
+POLL_INTERVAL = 2
+IDLE_CLOSE = 60        # drop the SMTP session after this long without mail
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30      # seconds; doubles per attempt
+BACKOFF_MAX = 3600
+
+_sender = {"pid": None, "wake": threading.Event()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, sender TEXT, recipient TEXT, message TEXT,
+    status TEXT DEFAULT 'queued', attempts INTEGER DEFAULT 0, error TEXT,
+    enqueued REAL, next_try REAL, sent_at REAL);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_try);
+"""
+
+_db = local_db.connector("mail_queue.db", SCHEMA)
+
+def enqueue(sender, recipient, message):
+    """Queues a rendered email.message.Message; returns the outbox id"""
+    now = time.time()
+    with _db() as conn:
+        row_id = conn.execute("INSERT INTO outbox (sender, recipient, message, enqueued, next_try) VALUES (?, ?, ?, ?, ?)",
+                              (sender, recipient, message.as_string(), now, now)).lastrowid
+    _sender["wake"].set()
+    return row_id
+
+def stats():
+    """Queue depth and delivery latency, for the admin/metrics routes"""
+    conn = _db()
+    counts = dict(conn.execute("SELECT status, count(*) FROM outbox GROUP BY status").fetchall())
+    oldest = conn.execute("SELECT min(enqueued) FROM outbox WHERE status = 'queued'").fetchone()[0]
+    latency = conn.execute("SELECT avg(sent_at - enqueued), max(sent_at - enqueued) FROM "
+                           "(SELECT sent_at, enqueued FROM outbox WHERE status = 'sent' ORDER BY id DESC LIMIT 100)").fetchone()
+    return {
+        "queued": counts.get("queued", 0), "sent": counts.get("sent", 0), "failed": counts.get("failed", 0),
+        "oldest_queued_age": round(time.time() - oldest, 3) if oldest else 0,
+        "avg_latency": round(latency[0] or 0, 3), "max_latency": round(latency[1] or 0, 3),
+    }
+
+class SmtpSession:
+    """Keeps one authenticated connection open across messages"""
+    def __init__(self, user, password):
+        self.user, self.password = user, password
+        self.conn = None
+        self.last_used = 0
+
+    def send(self, sender, recipient, raw):
+        for attempt in range(2):
+            if self.conn is None:
+                with metrics.timed("smtp", "connect"):
+                    self.conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+                    if SMTP_STARTTLS: self.conn.starttls()
+                    if self.user: self.conn.login(self.user, self.password)
+            try:
+                with metrics.timed("smtp", "sendmail"):
+                    self.conn.sendmail(sender, [recipient], raw.encode("utf-8"))
+                self.last_used = time.time()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.conn = None  # server dropped the idle session: reconnect once
+                if attempt: raise
+
+    def close_if_idle(self):
+        if self.conn is not None and time.time() - self.last_used > IDLE_CLOSE:
+            self.close()
+
+    def close(self):
+        try: self.conn.quit()
+        except Exception: pass
+        self.conn = None
+
+def deliver_due(session):
+    """Sends up to BATCH_SIZE due messages over the session; returns how many were sent"""
+    conn = _db()
+    now = time.time()
+    rows = conn.execute("SELECT id, sender, recipient, message, attempts FROM outbox "
+                        "WHERE status = 'queued' AND next_try <= ? ORDER BY id LIMIT ?", (now, BATCH_SIZE)).fetchall()
+    sent = 0
+    for row_id, sender, recipient, raw, attempts in rows:
+        try:
+            session.send(sender, recipient, raw)
+            with conn:
+                conn.execute("UPDATE outbox SET status = 'sent', sent_at = ?, attempts = ? WHERE id = ?", (time.time(), attempts + 1, row_id))
+            sent += 1
+        except Exception as e:
+            metrics.error("mail_delivery", e)
+            session.close()
+            attempts += 1
+            status = "failed" if attempts >= MAX_ATTEMPTS else "queued"
+            delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+            with conn:
+                conn.execute("UPDATE outbox SET status = ?, attempts = ?, error = ?, next_try = ? WHERE id = ?",
+                             (status, attempts, str(e)[:500], time.time() + delay, row_id))
+    return sent
+
+def _send_loop(user, password):
+    session = SmtpSession(user, password)
+    while True:
+        try:
+            # A full batch means a burst is in progress: go straight to the next one
+            if deliver_due(session) < BATCH_SIZE:
+                session.close_if_idle()
+                _sender["wake"].wait(POLL_INTERVAL)
+                _sender["wake"].clear()
+        except Exception as e:
+            print(f"Mail sender error: {e}")
+            metrics.error("mail_sender", e)
+            time.sleep(POLL_INTERVAL)
+
+def start_sender(user, password):
+    """Starts the sender thread in this process once"""
+    local_db.start_leader(_sender, "mail_sender.lock", POLL_INTERVAL * 5, _send_loop, user, password)
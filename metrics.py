@@ -0,0 +1,200 @@
+"""In-process instrumentation for the server, exposed in the Prometheus text format.
+
+    observe / inc       latency histograms and counters, keyed by name + labels
+    timed(dep, op)      times a call to an outside dependency (Firebase, SePay, SMTP,
+                        proof files, the device registry); exceptions are counted and re-raised
+    gauge(name, fn)     values computed when /metrics is scraped (registry size, rooms, ...)
+    InstrumentedDB      wraps firebase_admin.db so every reference / query read or write is timed
+
+Numbers are per process: run one gunicorn worker (see Procfile), or scrape
+each worker. TIMING_LOG=1 also prints one JSON line per request with the time spent in
+each dependency.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+TIMING_LOG = os.getenv("TIMING_LOG", "0") not in ("0", "false", "False", "")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_histograms = {}   # name -> {labels: [count per bucket..., count, sum]}
+_counters = {}     # name -> {labels: value}
+_gauges = {}       # name -> fn returning a number or [(labels dict, number), ...]
+_help = {}
+_local = threading.local()  # timings of the current request, for TIMING_LOG
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def describe(name, text):
+    _help[name] = text
+
+def observe(name, seconds, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        h = series.get(key)
+        if h is None:
+            h = series[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+                break
+        h[-2] += 1
+        h[-1] += seconds
+
+def inc(name, amount=1, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+def gauge(name, fn, text=None):
+    _gauges[name] = fn
+    if text: describe(name, text)
+
+def error(where, exc=None):
+    """Counts an error that is handled (logged and swallowed) rather than raised"""
+    inc("focus_errors_total", where=where, type=type(exc).__name__ if exc else "")
+
+@contextmanager
+def timed(dependency, op=""):
+    t = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        inc("focus_dependency_errors_total", dependency=dependency, op=op, type=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t
+        observe("focus_dependency_duration_seconds", elapsed, dependency=dependency, op=op)
+        spans = getattr(_local, "spans", None)
+        if spans is not None:
+            spans[dependency] = spans.get(dependency, 0) + elapsed
+
+# --- PER REQUEST ---
+
+def begin_request():
+    _local.start = time.perf_counter()
+    _local.spans = {} if TIMING_LOG else None
+
+def end_request(route, method, status):
+    start = getattr(_local, "start", None)
+    if start is None: return
+    elapsed = time.perf_counter() - start
+    _local.start = None
+    observe("focus_http_request_duration_seconds", elapsed, route=route, method=method, status=str(status))
+    if TIMING_LOG:
+        spans = _local.spans or {}
+        print(json.dumps({"route": route, "method": method, "status": status, "ms": round(elapsed * 1000, 2),
+                          "deps_ms": {k: round(v * 1000, 2) for k, v in spans.items()}}), flush=True)
+        _local.spans = None
+
+# --- FIREBASE ---
+
+class _Query:
+    def __init__(self, query, op):
+        self._query, self._op = query, op
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if name in ("start_at", "end_at", "equal_to", "limit_to_first", "limit_to_last", "order_by_child"):
+            return lambda *a, **kw: _Query(attr(*a, **kw), self._op)
+        return attr
+
+    def get(self, *a, **kw):
+        with timed("firebase", self._op + ".query"):
+            return self._query.get(*a, **kw)
+
+class _Ref:
+    def __init__(self, ref, path):
+        self._ref = ref
+        # Label by top-level node only ("transactions", "licenses"), never by key
+        self._op = path.strip("/").split("/", 1)[0] or "root"
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+    def _call(self, method, *a, **kw):
+        with timed("firebase", f"{self._op}.{method}"):
+            return getattr(self._ref, method)(*a, **kw)
+
+    def get(self, *a, **kw): return self._call("get", *a, **kw)
+    def set(self, *a, **kw): return self._call("set", *a, **kw)
+    def update(self, *a, **kw): return self._call("update", *a, **kw)
+    def delete(self, *a, **kw): return self._call("delete", *a, **kw)
+    def push(self, *a, **kw): return self._call("push", *a, **kw)
+
+    def order_by_child(self, child):
+        return _Query(self._ref.order_by_child(child), self._op)
+
+class InstrumentedDB:
+    """Same interface as the firebase_admin.db module for the calls server.py makes"""
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def reference(self, path="/", *a, **kw):
+        return _Ref(self._db.reference(path, *a, **kw), path)
+
+# --- EXPOSITION ---
+
+def _fmt_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    def head(name, kind):
+        if name in _help: lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        histograms = {n: {k: list(h) for k, h in s.items()} for n, s in _histograms.items()}
+        counters = {n: dict(s) for n, s in _counters.items()}
+    for name in sorted(histograms):
+        head(name, "histogram")
+        for key, h in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, h):
+                cumulative += count
+                lines.append(f"{name}_bucket{_fmt_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_fmt_labels(key, [('le', '+Inf')])} {h[-2]}")
+            lines.append(f"{name}_sum{_fmt_labels(key)} {_num(h[-1])}")
+            lines.append(f"{name}_count{_fmt_labels(key)} {h[-2]}")
+    for name in sorted(counters):
+        head(name, "counter")
+        for key, value in sorted(counters[name].items()):
+            lines.append(f"{name}{_fmt_labels(key)} {_num(value)}")
+    for name in sorted(_gauges):
+        try:
+            value = _gauges[name]()
+        except Exception as e:
+            error(f"gauge:{name}", e)
+            continue
+        head(name, "gauge")
+        if isinstance(value, list):
+            for labels, v in value:
+                lines.append(f"{name}{_fmt_labels(_labels(labels))} {_num(v)}")
+        else:
+            lines.append(f"{name} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+describe("focus_http_request_duration_seconds", "Time spent in each route handler (SSE: until the stream starts)")
+describe("focus_dependency_duration_seconds", "Time spent in calls to Firebase, SePay, SMTP, proof files and the device registry")
+describe("focus_dependency_errors_total", "Dependency calls that raised")
+describe("focus_errors_total", "Errors that were handled and logged instead of raised")
+describe("focus_cache_requests_total", "Cache lookups by cache and result")
+describe("focus_rate_limited_total", "Requests refused with 429 by a token bucket")
+describe("focus_coalesced_total", "Calls that shared an in-flight call for the same key instead of running")
@@ -0,0 +1,122 @@
+"""Content-addressed storage for distraction proof images.
+
+Uploads are streamed to disk while being hashed and stored once per distinct content
+as proofs/blobs/<sha256>.jpg, with small thumbnails pre-generated next to them. Each
+room keeps a bounded history ring (HISTORY_SIZE entries, RETENTION_SECS) in SQLite;
+blobs no history entry points to any more are garbage collected.
+"""
+import os
+import re
+import time
+import uuid
+import hashlib
+
+import local_db
+
+try:
+    import cv2 # type: ignore
+except ImportError:
+    cv2 = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROOFS_DIR = os.path.join(BASE_DIR, "proofs")
+BLOB_DIR = os.path.join(PROOFS_DIR, "blobs")
+
+HISTORY_SIZE = 50
+RETENTION_SECS = 7 * 24 * 3600
+THUMB_WIDTHS = (160,)
+CHUNK = 64 * 1024
+GC_INTERVAL = 3600
+GC_GRACE = 3600  # never collect blobs written or re-uploaded within the last hour
+
+BLOB_NAME = re.compile(r"^([0-9a-f]{64})(?:_(\d+))?\.jpg$")
+
+_gc = {"last": 0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT, session_id INTEGER, hash TEXT, ts REAL);
+CREATE INDEX IF NOT EXISTS history_code ON history (code, id);
+"""
+
+_db = local_db.connector("proofs.db", SCHEMA)
+
+def blob_path(digest, width=None):
+    return os.path.join(BLOB_DIR, f"{digest}_{width}.jpg" if width else f"{digest}.jpg")
+
+def _write_stream(stream):
+    """Copies the upload to a temp file in chunks while hashing it; returns (digest, temp path)"""
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    tmp = os.path.join(BLOB_DIR, f".upload-{uuid.uuid4().hex}")
+    sha = hashlib.sha256()
+    with open(tmp, "wb") as f:
+        while True:
+            chunk = stream.read(CHUNK)
+            if not chunk: break
+            sha.update(chunk)
+            f.write(chunk)
+    return sha.hexdigest(), tmp
+
+def _make_thumbnails(digest):
+    if cv2 is None: return
+    img = cv2.imread(blob_path(digest))
+    if img is None: return
+    h, w = img.shape[:2]
+    for width in THUMB_WIDTHS:
+        if width >= w: continue
+        thumb = cv2.resize(img, (width, max(1, h * width // w)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", thumb, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        if not ok: continue
+        tmp = blob_path(digest, width) + ".tmp"
+        with open(tmp, "wb") as f: f.write(buf.tobytes())
+        os.replace(tmp, blob_path(digest, width))
+
+def save(code, session_id, stream):
+    """Stores an uploaded proof for a room and returns its content hash"""
+    digest, tmp = _write_stream(stream)
+    final = blob_path(digest)
+    if os.path.exists(final):
+        os.remove(tmp)
+        os.utime(final)  # identical upload: keep one copy, refresh it for the GC grace period
+    else:
+        os.replace(tmp, final)
+        _make_thumbnails(digest)
+    conn = _db()
+    with conn:
+        conn.execute("INSERT INTO history (code, session_id, hash, ts) VALUES (?, ?, ?, ?)", (code, session_id, digest, time.time()))
+        conn.execute("DELETE FROM history WHERE code = ? AND id NOT IN "
+                     "(SELECT id FROM history WHERE code = ? ORDER BY id DESC LIMIT ?)", (code, code, HISTORY_SIZE))
+    maybe_collect()
+    return digest
+
+def latest(code):
+    row = _db().execute("SELECT hash FROM history WHERE code = ? ORDER BY id DESC LIMIT 1", (code,)).fetchone()
+    return row[0] if row else None
+
+def history(code, session_id=None):
+    sql, args = "SELECT hash, ts, session_id FROM history WHERE code = ?", [code]
+    if session_id is not None:
+        sql, args = sql + " AND session_id = ?", args + [session_id]
+    rows = _db().execute(sql + " ORDER BY id DESC", args).fetchall()
+    return [{"hash": h, "ts": ts, "session_id": sid} for h, ts, sid in rows]
+
+def thumb_width(digest):
+    """Smallest pre-generated thumbnail width for a blob, or None"""
+    for width in THUMB_WIDTHS:
+        if os.path.exists(blob_path(digest, width)): return width
+    return None
+
+def maybe_collect():
+    now = time.time()
+    if now - _gc["last"] < GC_INTERVAL: return
+    _gc["last"] = now
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM history WHERE ts < ?", (now - RETENTION_SECS,))
+    live = {h for (h,) in conn.execute("SELECT DISTINCT hash FROM history")}
+    for name in os.listdir(BLOB_DIR):
+        m = BLOB_NAME.match(name)
+        if not m or m.group(1) in live: continue
+        original = blob_path(m.group(1))
+        stamp = original if os.path.exists(original) else os.path.join(BLOB_DIR, name)
+        if now - os.path.getmtime(stamp) > GC_GRACE:
+            os.remove(os.path.join(BLOB_DIR, name))
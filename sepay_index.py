@@ -0,0 +1,102 @@
+"""Local index of incoming SePay bank transfers, keyed by normalized note token.
+
+Transfers arrive through the /sepay/webhook route or, as a fallback, from a single
+background poller shared by all gunicorn workers (whichever worker holds the lock
+file polls). /check_payment_status then only does a primary-key lookup here.
+"""
+import re
+import time
+import threading
+
+import metrics
+import local_db
+
+POLL_INTERVAL = 10
+POLL_LIMIT = 100
+NOTE_TTL = 3 * 24 * 3600  # forget unpaid notes and unmatched transfers after 3 days
+
+_poller = {"pid": None, "wake": threading.Event()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (token TEXT PRIMARY KEY, created REAL);
+CREATE TABLE IF NOT EXISTS payments (token TEXT PRIMARY KEY, amount REAL, bank_ref TEXT, paid_at TEXT);
+CREATE TABLE IF NOT EXISTS unmatched (bank_ref TEXT PRIMARY KEY, content TEXT, amount REAL, paid_at TEXT, seen REAL);
+CREATE TABLE IF NOT EXISTS seen (bank_ref TEXT PRIMARY KEY);
+"""
+
+def normalize(text):
+    return re.sub(r"[^A-Z0-9]", "", str(text or "").upper())
+
+_db = local_db.connector("sepay_index.db", SCHEMA)
+
+def register_note(note):
+    """Marks a transaction note as awaited and matches it against transfers that came early"""
+    token = normalize(note)
+    if not token: return
+    conn = _db()
+    with conn:
+        if conn.execute("INSERT OR IGNORE INTO notes VALUES (?, ?)", (token, time.time())).rowcount:
+            row = conn.execute("SELECT bank_ref, amount, paid_at FROM unmatched WHERE instr(content, ?) > 0 LIMIT 1", (token,)).fetchone()
+            if row:
+                conn.execute("INSERT OR IGNORE INTO payments VALUES (?, ?, ?, ?)", (token, row[1], row[0], row[2]))
+                conn.execute("DELETE FROM unmatched WHERE bank_ref = ?", (row[0],))
+
+def lookup(note):
+    row = _db().execute("SELECT amount, bank_ref, paid_at FROM payments WHERE token = ?", (normalize(note),)).fetchone()
+    if row:
+        return {"amount": row[0], "bank_ref": row[1], "paid_at": row[2]}
+    return None
+
+def ingest(bank_ref, content, amount, paid_at):
+    """Stores one incoming transfer. Returns the matched token, or None. Idempotent per bank_ref."""
+    bank_ref, content = str(bank_ref), normalize(content)
+    conn = _db()
+    with conn:
+        if not conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (bank_ref,)).rowcount:
+            return None
+        row = conn.execute("SELECT token FROM notes WHERE instr(?, token) > 0 ORDER BY length(token) DESC LIMIT 1", (content,)).fetchone()
+        if row:
+            conn.execute("INSERT OR IGNORE INTO payments VALUES (?, ?, ?, ?)", (row[0], float(amount or 0), bank_ref, paid_at))
+            return row[0]
+        conn.execute("INSERT OR IGNORE INTO unmatched VALUES (?, ?, ?, ?, ?)", (bank_ref, content, float(amount or 0), paid_at, time.time()))
+    return None
+
+def ingest_api_transactions(transactions):
+    """Ingests rows from SePay's userapi transactions/list"""
+    for tx in transactions:
+        if float(tx.get("amount_in") or 0) > 0:
+            ingest(tx.get("id"), tx.get("transaction_content"), tx.get("amount_in"), tx.get("transaction_date"))
+
+def prune():
+    cutoff = time.time() - NOTE_TTL
+    with _db() as conn:
+        conn.execute("DELETE FROM notes WHERE created < ?", (cutoff,))
+        conn.execute("DELETE FROM unmatched WHERE seen < ?", (cutoff,))
+
+def pending_count():
+    return _db().execute("SELECT count(*) FROM notes WHERE token NOT IN (SELECT token FROM payments)").fetchone()[0]
+
+# --- FALLBACK POLLER ---
+
+def _poll_loop(fetch):
+    last_prune = 0
+    while True:
+        _poller["wake"].wait(POLL_INTERVAL)
+        _poller["wake"].clear()
+        try:
+            if pending_count():
+                ingest_api_transactions(fetch(POLL_LIMIT))
+            if time.time() - last_prune > 3600:
+                prune()
+                last_prune = time.time()
+        except Exception as e:
+            print(f"SePay poller error: {e}")
+            metrics.error("sepay_poller", e)
+
+def start_poller(fetch):
+    """Starts the fallback poller in this process once. fetch(limit) returns SePay transaction rows."""
+    local_db.start_leader(_poller, "sepay_poller.lock", POLL_INTERVAL * 3, _poll_loop, fetch)
+
+def nudge_poller():
+    """Asks the poller to fetch now; only has an effect in the process that holds the lock"""
+    _poller["wake"].set()
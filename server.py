@@ -2,30 +2,52 @@ import os
 import random
 import string
 import json
-import smtplib
+import math
+import hmac
 import time
+import threading
 import requests
+from bisect import bisect_left
+from collections import OrderedDict
 from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import firebase_admin # type: ignore
 from firebase_admin import credentials, db # type: ignore
 from dotenv import load_dotenv # type: ignore
+try:
+    import msgpack # type: ignore
+except ImportError:
+    msgpack = None
+
+import sepay_index
+import mail_queue
+import proof_store
+import session_store
+import metrics
+from throttle import TokenBuckets, SingleFlight
+from device_registry import create_registry, RegistryWatcher
 
 # Load configuration
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+# Render's proxy appends the peer to X-Forwarded-For: trust that many hops from the right
+# (earlier hops are whatever the client sent). TRUSTED_PROXIES=0 when serving directly.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", 1))
+if TRUSTED_PROXIES: app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 
 # --- CONFIGURATION ---
 FIREBASE_URL = os.getenv("FIREBASE_DATABASE_URL")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
 SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
 SEPAY_API_KEY = os.getenv("SEPAY_API_KEY")
+SEPAY_WEBHOOK_KEY = os.getenv("SEPAY_WEBHOOK_KEY")
 
 # --- FIREBASE INIT ---
 RENDER_SECRET_PATH = "/etc/secrets/serviceAccountKey.json"
@@ -40,18 +62,67 @@ try:
 except Exception as e:
     print(f"❌ Firebase Init Error: {e}")
 
+db = metrics.InstrumentedDB(db)  # every Firebase read/write is timed (see /metrics)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROOFS_DIR = os.path.join(BASE_DIR, "proofs")
 if not os.path.exists(PROOFS_DIR): os.makedirs(PROOFS_DIR)
 
-# Device State (RAM)
-device_registry = {}
+# Device State: shared across workers (see device_registry.py, DEVICE_REGISTRY env)
+device_registry = create_registry()
+registry_watcher = RegistryWatcher(device_registry)
+OFFLINE_DEVICE = {"is_distracted": False, "reason": "Offline", "seconds": 0, "session_id": 0}
+STREAM_TICK_SECS = 15
+LONG_POLL_MAX_SECS = 55
+# Clients re-send an unchanged state every HEARTBEAT_SECS (Src/status_client.py); a room
+# silent for STALE_AFTER_SECS is shown as Offline instead of a timer that keeps running.
+# session_store stops crediting a silent session at the same threshold.
+HEARTBEAT_SECS = session_store.HEARTBEAT_SECS
+STALE_AFTER_SECS = session_store.GAP_SECS
+# Under WSGI (gthread) every SSE stream and long-poll holds a worker thread for its whole
+# life: cap them per process so they never starve /update_status. asgi.py (the Procfile
+# default) serves them on the event loop instead and does not use these slots.
+MAX_WSGI_STREAMS = int(os.getenv("MAX_WSGI_STREAMS", 32))
+STREAM_RETRY_SECS = 5
+stream_slots = threading.BoundedSemaphore(MAX_WSGI_STREAMS)
+
+# License cache (RAM): key -> (expires_at, record). Paid keys are cached for
+# LICENSE_CACHE_TTL, unknown / unpaid keys (record None) for LICENSE_MISS_TTL.
+LICENSE_CACHE_TTL = 300
+LICENSE_MISS_TTL = 30
+# Unindexed keys fall back to a transactions query (needs ".indexOn": ["license_key"]).
+# Set LICENSE_TX_FALLBACK=0 once `flask --app server backfill-licenses` has run.
+LICENSE_TX_FALLBACK = os.getenv("LICENSE_TX_FALLBACK", "1") != "0"
+LICENSE_CACHE_MAX = 2048
+license_cache = OrderedDict()
+license_cache_lock = threading.Lock()
+
+# Ledger cache (RAM): rows keyed by note, kept current by pulling only transactions
+# whose updated_at moved since the last sync. A full re-read catches deletions.
+LEDGER_REFRESH_SECS = 5
+LEDGER_FULL_RESYNC_SECS = 600
+ledger_cache = {"rows": {}, "order": [], "synced_at": None, "checked_at": 0, "loaded_at": 0}
+ledger_lock = threading.Lock()
+
+# /check_payment_status is polled by every buyer on the payment screen: limit per IP and
+# per note, and tell clients when to ask again (Retry-After, also on "not found yet")
+PAYMENT_POLL_SECS = int(os.getenv("PAYMENT_POLL_SECS", 3))
+payment_ip_limit = TokenBuckets(float(os.getenv("PAYMENT_IP_RATE", 2)), int(os.getenv("PAYMENT_IP_BURST", 10)))
+payment_note_limit = TokenBuckets(float(os.getenv("PAYMENT_NOTE_RATE", 0.5)), int(os.getenv("PAYMENT_NOTE_BURST", 3)))
+payment_flight = SingleFlight()
+REQUIRED_AMOUNT = 315000
+
+# SePay transaction list: one fetch in flight at a time, reused for SEPAY_LIST_TTL seconds
+SEPAY_LIST_TTL = 5
+sepay_list_cache = {"at": 0, "limit": 0, "rows": []}
+sepay_flight = SingleFlight()
 
 # --- HELPERS ---
 def generate_id(length=6):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
 def send_license_email(to_email, key, tier):
+    """Queues the license email; mail_queue delivers it in the background"""
     msg = MIMEMultipart()
     msg['From'] = f"GFocus Team <{SENDER_EMAIL}>"
     msg['To'] = to_email
@@ -59,52 +130,272 @@ def send_license_email(to_email, key, tier):
     body = f"Mã kích hoạt của bạn: {key}\nGói: {tier}"
     msg.attach(MIMEText(body, 'plain', 'utf-8'))
     try:
-        s = smtplib.SMTP("smtp.gmail.com", 587)
-        s.starttls()
-        s.login(SENDER_EMAIL, SENDER_PASSWORD)
-        s.send_message(msg)
-        s.quit()
+        mail_queue.enqueue(SENDER_EMAIL, to_email, msg)
         return True
-    except: return False
+    except Exception as e:
+        print(f"❌ Mail queue error: {e}")
+        metrics.error("mail_enqueue", e)
+        return False
 
-def check_payment_via_sepay(transaction_note):
+if SENDER_EMAIL: mail_queue.start_sender(SENDER_EMAIL, SENDER_PASSWORD)
+
+sepay_http = requests.Session()  # keeps the TLS connection to SePay alive between polls
+
+def fetch_sepay_transactions(limit=50):
     SEPAY_API_URL_NEW = "https://my.sepay.vn/userapi/transactions/list"
     api_key = SEPAY_API_KEY if SEPAY_API_KEY.startswith("Bearer ") else f"Bearer {SEPAY_API_KEY}"
     headers = {"Authorization": api_key, "Content-Type": "application/json"}
-    try:
-        response = requests.get(SEPAY_API_URL_NEW, headers=headers, params={"limit": 50})
-        if response.status_code == 200:
-            data = response.json()
-            search_target = str(transaction_note).replace("-", "").replace(" ", "").upper()
-            for tx in data.get("transactions", []):
-                content_clean = str(tx.get("transaction_content", "")).upper().replace("-", "").replace(" ", "").replace(".", "")
-                if search_target in content_clean:
-                    return {"amount": float(tx.get("amount_in", 0)), "bank_ref": tx.get("id"), "paid_at": tx.get("transaction_date")}
-    except: pass
-    return None
+    with metrics.timed("sepay", "transactions_list"):
+        response = sepay_http.get(SEPAY_API_URL_NEW, headers=headers, params={"limit": limit}, timeout=15)
+        response.raise_for_status()
+    return response.json().get("transactions", [])
+
+def cached_sepay_transactions(limit=50):
+    """fetch_sepay_transactions behind a short TTL cache and single-flight"""
+    def fetch():
+        if time.time() - sepay_list_cache["at"] < SEPAY_LIST_TTL and sepay_list_cache["limit"] >= limit:
+            metrics.inc("focus_cache_requests_total", cache="sepay_list", result="hit")
+            return sepay_list_cache["rows"][:limit]
+        metrics.inc("focus_cache_requests_total", cache="sepay_list", result="miss")
+        rows = fetch_sepay_transactions(limit)
+        sepay_list_cache.update(at=time.time(), limit=limit, rows=rows)
+        return rows
+    rows, shared = sepay_flight.do("list", fetch)
+    if shared: metrics.inc("focus_coalesced_total", call="sepay_list")
+    return rows
+
+def check_payment_via_sepay(transaction_note):
+    """Local lookup only: transfers reach the index via /sepay/webhook or the fallback poller"""
+    sepay_index.register_note(transaction_note)
+    payment = sepay_index.lookup(transaction_note)
+    if payment is None: sepay_index.nudge_poller()
+    return payment
+
+if SEPAY_API_KEY: sepay_index.start_poller(cached_sepay_transactions)
+session_store.start_compactor()
+
+# --- LICENSE INDEX ---
+# licenses/<key> mirrors the fields of transactions/<note> needed to verify a key,
+# so /verify_license is a single child read instead of a scan of every sale.
+
+def is_valid_license_key(key):
+    return isinstance(key, str) and key != "" and not any(c in key for c in "./#$[]")
+
+def index_license(note, tx):
+    key = tx.get('license_key')
+    if not is_valid_license_key(key): return
+    db.reference(f'licenses/{key}').set({"note": note, "status": tx.get('status'), "tier": tx.get('tier')})
+    invalidate_license(key)
+
+def invalidate_license(key):
+    with license_cache_lock:
+        license_cache.pop(key, None)
+
+def lookup_license(key):
+    """Returns the licenses/<key> record of a paid license key, or None"""
+    now = time.time()
+    with license_cache_lock:
+        hit = license_cache.get(key)
+        if hit and hit[0] > now:
+            license_cache.move_to_end(key)
+            metrics.inc("focus_cache_requests_total", cache="license", result="hit")
+            return hit[1]
+    metrics.inc("focus_cache_requests_total", cache="license", result="miss")
+    record = db.reference(f'licenses/{key}').get()
+    if record is None and LICENSE_TX_FALLBACK:
+        # Not indexed yet (sold before the index existed): one indexed query, then heal the index
+        try:
+            found = db.reference('transactions').order_by_child('license_key').equal_to(key).get() or {}
+        except Exception as e:
+            metrics.error("license_fallback", e)
+            return None  # not cached: the next call retries
+        for note, tx in found.items():
+            index_license(note, tx)
+            record = {"note": note, "status": tx.get('status'), "tier": tx.get('tier')}
+    if not record or record.get('status') != 'paid':
+        record = None
+    with license_cache_lock:
+        license_cache[key] = (now + (LICENSE_CACHE_TTL if record else LICENSE_MISS_TTL), record)
+        license_cache.move_to_end(key)
+        while len(license_cache) > LICENSE_CACHE_MAX:
+            license_cache.popitem(last=False)
+    return record
+
+@app.cli.command('backfill-licenses')
+def backfill_licenses():
+    """Builds licenses/<key> from existing transactions: flask --app server backfill-licenses"""
+    all_tx = db.reference('transactions').get() or {}
+    index = {}
+    for note, tx in all_tx.items():
+        if is_valid_license_key(tx.get('license_key')):
+            index[tx['license_key']] = {"note": note, "status": tx.get('status'), "tier": tx.get('tier')}
+    if index: db.reference('licenses').update(index)
+    print(f"✅ Indexed {len(index)} license keys from {len(all_tx)} transactions (LICENSE_TX_FALLBACK=0 can now be set)")
+
+# --- LEDGER CACHE ---
+
+def ledger_row(note, data):
+    return {
+        "note": note, "email": data.get('email'), "license_key": data.get('license_key'),
+        "amount": data.get('amount_received', 0), "status": data.get('status'),
+        "tier": data.get('tier'), "date": data.get('created_at', "")
+    }
+
+def sync_ledger():
+    """Brings ledger_cache up to date and returns it. Safe to call on every request."""
+    now = time.time()
+    with ledger_lock:
+        if now - ledger_cache["checked_at"] < LEDGER_REFRESH_SECS:
+            metrics.inc("focus_cache_requests_total", cache="ledger", result="hit")
+            return ledger_cache
+        ref = db.reference('transactions')
+        full = ledger_cache["synced_at"] is None or now - ledger_cache["loaded_at"] > LEDGER_FULL_RESYNC_SECS
+        metrics.inc("focus_cache_requests_total", cache="ledger", result="full" if full else "delta")
+        if full:
+            changed = ref.get() or {}
+            ledger_cache["rows"] = {}
+            ledger_cache["loaded_at"] = now
+        else:
+            changed = ref.order_by_child('updated_at').start_at(ledger_cache["synced_at"]).get() or {}
+        for note, data in changed.items():
+            ledger_cache["rows"][note] = ledger_row(note, data)
+            if data.get('updated_at', "") > (ledger_cache["synced_at"] or ""):
+                ledger_cache["synced_at"] = data['updated_at']
+        if ledger_cache["synced_at"] is None: ledger_cache["synced_at"] = ""
+        if changed or full:
+            # Ascending (date, note) keys; pages are read from the end
+            ledger_cache["order"] = sorted((r["date"], n) for n, r in ledger_cache["rows"].items())
+        ledger_cache["checked_at"] = now
+        return ledger_cache
 
 # --- ADMIN ROUTES ---
 
 @app.route('/admin/ledger', methods=['GET'])
 def get_admin_ledger():
+    """Newest first. Optional: status, tier, from, to, limit, cursor (from X-Next-Cursor)."""
+    limit = request.args.get('limit', '0')
+    if not limit.isdigit(): return jsonify({"error": "limit must be a non-negative integer"}), 400
+    limit = int(limit) or None
     try:
-        all_tx = db.reference('transactions').get() or {}
-        ledger = []
-        for note, data in all_tx.items():
-            ledger.append({
-                "email": data.get('email'), "license_key": data.get('license_key'),
-                "amount": data.get('amount_received', 0), "status": data.get('status'),
-                "tier": data.get('tier'), "date": data.get('created_at', "")
-            })
-        return jsonify(sorted(ledger, key=lambda x: x['date'], reverse=True))
-    except Exception as e: return jsonify({"error": str(e)}), 500
+        cache = sync_ledger()
+        rows, order = cache["rows"], cache["order"]
+        args = request.args
+        status, tier = args.get('status'), (args.get('tier') or '').upper()
+        date_from, date_to = args.get('from'), args.get('to')
 
-@app.route('/admin/live-rooms', methods=['GET'])
-def get_live_rooms():
+        end = len(order)
+        cursor = args.get('cursor')
+        if cursor and '|' in cursor:
+            end = bisect_left(order, tuple(cursor.split('|', 1)))
+        if date_to:
+            end = min(end, bisect_left(order, (date_to + '\uffff',)))
+
+        ledger, next_cursor = [], None
+        for i in range(end - 1, -1, -1):
+            date, note = order[i]
+            if date_from and date < date_from: break
+            row = rows[note]
+            if status and row["status"] != status: continue
+            if tier and row["tier"] != tier: continue
+            if limit and len(ledger) == limit:
+                next_cursor = f"{ledger[-1]['date']}|{ledger[-1]['note']}"
+                break
+            ledger.append(row)
+
+        resp = jsonify(ledger)
+        if next_cursor: resp.headers['X-Next-Cursor'] = next_cursor
+        resp.add_etag()
+        return resp.make_conditional(request)
+    except Exception as e:
+        metrics.error("admin_ledger", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/mail-queue', methods=['GET'])
+def get_mail_queue():
+    return jsonify(mail_queue.stats())
+
+def live_rooms():
     rooms = []
     for code, info in device_registry.items():
-        rooms.append({"code": code, "status": "Distracted" if info.get('is_distracted') else "Focused", "is_danger": info.get('is_distracted')})
-    return jsonify(rooms)
+        if is_stale(info): status = "Offline"
+        else: status = "Distracted" if info.get('is_distracted') else "Focused"
+        rooms.append({"code": code, "status": status, "is_danger": presence(info).get('is_distracted')})
+    return rooms
+
+def offline_rooms(rooms):
+    """Codes shown Offline: a room going stale changes this without a registry write"""
+    return {room["code"] for room in rooms if room["status"] == "Offline"}
+
+def sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def streams_full():
+    metrics.inc("focus_wsgi_streams_rejected_total")
+    return retry_later({"error": "Too many open streams"}, STREAM_RETRY_SECS, 503)
+
+def sse_response(stream):
+    if not stream_slots.acquire(blocking=False): return streams_full()
+    resp = Response(stream, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    resp.call_on_close(stream_slots.release)
+    return resp
+
+def parse_since(last_event_id, since):
+    """Version the client already has: Last-Event-ID on reconnect, else ?since=, else -1.
+    ValueError on anything but an integer."""
+    return int(last_event_id or since or -1)
+
+def parse_wait(wait):
+    """Long-poll ?wait= seconds, default 25, within [0, LONG_POLL_MAX_SECS]"""
+    seconds = float(25 if wait is None else wait)
+    if seconds != seconds: raise ValueError("wait is NaN")
+    return min(max(seconds, 0), LONG_POLL_MAX_SECS)
+
+BAD_STREAM_PARAMS = {"error": "since / Last-Event-ID must be integers and wait a number of seconds"}
+
+def stream_since():
+    return parse_since(request.headers.get('Last-Event-ID'), request.args.get('since'))
+
+@app.route('/admin/analytics/sessions/<code>', methods=['GET'])
+def get_room_sessions(code):
+    """The room's focus sessions, newest first. Optional: limit (default 50)."""
+    return jsonify(session_store.sessions(code, min(int(request.args.get('limit', 50)), 500)))
+
+@app.route('/admin/analytics/sessions/<code>/<int:session_id>', methods=['GET'])
+def get_room_session(code, session_id):
+    """One session with its timeline of focused / distracted intervals"""
+    result = session_store.session(code, session_id)
+    if result is None: return jsonify({"error": "Session not found"}), 404
+    return jsonify(result)
+
+@app.route('/admin/analytics/daily', methods=['GET'])
+def get_daily_focus():
+    """Focus totals per UTC day. Optional: code (else all rooms), from, to (YYYY-MM-DD)."""
+    args = request.args
+    return jsonify(session_store.daily(args.get('code'), args.get('from'), args.get('to')))
+
+@app.route('/admin/live-rooms', methods=['GET'])
+def get_live_rooms():
+    return jsonify(live_rooms())
+
+@app.route('/admin/live-rooms/stream', methods=['GET'])
+def stream_live_rooms():
+    try:
+        since = stream_since()
+    except ValueError:
+        return jsonify(BAD_STREAM_PARAMS), 400
+    def events(version):
+        offline = set()
+        while True:
+            current = registry_watcher.wait(version, STREAM_TICK_SECS)
+            rooms = live_rooms()
+            was_offline, offline = offline, offline_rooms(rooms)
+            if current > version or offline != was_offline:
+                version = max(current, version)
+                yield sse("rooms", rooms, version)
+            else:
+                yield ": keep-alive\n\n"
+    return sse_response(events(since))
 
 # --- APP ROUTES ---
 
@@ -118,58 +409,184 @@ def confirm():
     data = request.json
     note, email, plan = data.get('transaction_note'), data.get('email'), data.get('plan', 'PRO').upper()
     if not note or not email: return jsonify({"error": "Missing data"}), 400
-    db.reference(f'transactions/{note}').set({
+    tx = {
         "email": email, "status": "pending", "tier": plan,
-        "license_key": f"GF-{generate_id(12)}", "created_at": datetime.now().isoformat()
-    })
+        "license_key": f"GF-{generate_id(12)}", "created_at": datetime.now().isoformat(),
+        "updated_at": datetime.now().isoformat()
+    }
+    db.reference(f'transactions/{note}').set(tx)
+    index_license(note, tx)
+    sepay_index.register_note(note)
     return jsonify({"status": "pending"})
 
+def client_ip():
+    return request.remote_addr or ''  # the hop our proxy saw (ProxyFix)
+
+def retry_later(body, seconds, code=200):
+    resp = jsonify({**body, "retry_after": seconds})
+    resp.status_code = code
+    resp.headers['Retry-After'] = str(seconds)
+    return resp
+
+def settle_payment(note, amount):
+    """Marks the transaction paid (once) and returns the success payload, or None"""
+    ref = db.reference(f'transactions/{note}')
+    tx = ref.get()
+    if not tx or amount < REQUIRED_AMOUNT: return None
+    if tx.get('status') == 'pending':
+        ref.update({"status": "paid", "amount_received": amount, "updated_at": datetime.now().isoformat()})
+        index_license(note, {**tx, "status": "paid"})
+        send_license_email(tx['email'], tx['license_key'], tx['tier'])
+    return {"status": "success", "license_key": tx['license_key'], "tier": tx['tier']}
+
 @app.route('/check_payment_status', methods=['POST'])
 def check_status():
     data = request.json
     note = data.get('transaction_note')
-    REQUIRED_AMOUNT = 315000
+    for scope, limiter, key in (("ip", payment_ip_limit, client_ip()), ("note", payment_note_limit, note)):
+        wait = limiter.take(key)
+        if wait:
+            metrics.inc("focus_rate_limited_total", route="check_payment_status", scope=scope)
+            return retry_later({"status": "rate_limited"}, wait, 429)
     payment_info = check_payment_via_sepay(note)
     if payment_info:
-        ref = db.reference(f'transactions/{note}')
-        tx = ref.get()
-        if payment_info['amount'] >= REQUIRED_AMOUNT:
-            if tx.get('status') == 'pending':
-                ref.update({"status": "paid", "amount_received": payment_info['amount']})
-                send_license_email(tx['email'], tx['license_key'], tx['tier'])
-            return jsonify({"status": "success", "license_key": tx['license_key'], "tier": tx['tier']})
-    return jsonify({"status": "not_found_yet"}), 200
+        # Concurrent polls for one note share a single Firebase read / settlement,
+        # which also keeps a burst of polls from sending the license email twice
+        result, shared = payment_flight.do(note, lambda: settle_payment(note, payment_info['amount']))
+        if shared: metrics.inc("focus_coalesced_total", call="settle_payment")
+        if result: return jsonify(result)
+    return retry_later({"status": "not_found_yet"}, PAYMENT_POLL_SECS)
+
+@app.route('/sepay/webhook', methods=['POST'])
+def sepay_webhook():
+    """SePay pushes every bank transfer here (Authorization: Apikey <SEPAY_WEBHOOK_KEY>).
+    Without a configured key nothing is accepted: payments then settle through the poller."""
+    if not SEPAY_WEBHOOK_KEY:
+        return jsonify({"success": False, "error": "Webhook not configured"}), 503
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Apikey {SEPAY_WEBHOOK_KEY}".encode()):
+        return jsonify({"success": False}), 401
+    data = request.get_json(silent=True) or {}
+    if data.get('transferType') == 'in' and data.get('id') is not None:
+        sepay_index.ingest(data['id'], data.get('content') or data.get('description'), data.get('transferAmount'), data.get('transactionDate'))
+    return jsonify({"success": True})
 
 @app.route('/verify_license', methods=['POST'])
 def verify_license():
     key = request.json.get('license_key')
-    all_tx = db.reference('transactions').get() or {}
-    for note, data in all_tx.items():
-        if data.get('license_key') == key and data.get('status') == 'paid':
-            return jsonify({"valid": True, "tier": data.get('tier')})
+    record = lookup_license(key) if is_valid_license_key(key) else None
+    if record:
+        return jsonify({"valid": True, "tier": record.get('tier')})
     return jsonify({"valid": False}), 404
 
 # --- MONITORING ROUTES (FIXED) ---
 
+def clock_skew(values, received_at):
+    """Server minus client clock, from the sent_at the client stamped on the request"""
+    try:
+        return received_at - float(values['sent_at'])
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+def event_time(values, received_at, skew=0.0):
+    """When the event happened on the server's clock: the client's epoch ts corrected by the
+    skew, never later than its arrival (session_store clamps it to the session's last event)"""
+    try:
+        return min(float(values['ts']) + skew, received_at)
+    except (KeyError, TypeError, ValueError):
+        return received_at
+
+def normalize_event(values):
+    """A status report with its typed fields parsed: is_distracted bool, session_id and seconds
+    int, ts float (when sent). ValueError / TypeError on anything that does not parse."""
+    event = dict(values.items())
+    event['is_distracted'] = str(values.get('is_distracted', 'False')).lower() in ['true', '1']
+    event['session_id'] = int(values.get('session_id', 0))
+    event['seconds'] = int(values.get('seconds', 0))
+    if values.get('ts') is not None:
+        event['ts'] = float(values['ts'])
+        if not math.isfinite(event['ts']): raise ValueError("ts must be finite")
+    return event
+
+def apply_status(code, values, image=None, skew=0.0):
+    """Writes one status report (form fields or a batch event) to the registry"""
+    values = normalize_event(values)
+    is_distracted, session_id = values['is_distracted'], values['session_id']
+    fields = {
+        "is_distracted": is_distracted,
+        "reason": values.get('reason', 'Focusing'),
+        "timestamp": values.get('timestamp', ''),
+        "session_id": session_id,
+        "seconds": values['seconds'], # Timer data
+        "received_at": time.time()
+    }
+    if image is not None and is_distracted:
+        with metrics.timed("proof_store", "save"):
+            digest = proof_store.save(code, session_id, image.stream)
+        fields.update({"proof": digest, "proof_thumb": proof_store.thumb_width(digest)})
+    with metrics.timed("registry", "update"):
+        device_registry.update(code, fields)  # merge keeps the last proof when this update has none
+    try:
+        with metrics.timed("session_store", "record"):
+            session_store.record(code, session_id, is_distracted, fields["reason"], event_time(values, fields["received_at"], skew))
+    except Exception as e:
+        metrics.error("session_store", e)  # history is best effort, the live status is already written
+
 @app.route('/update_status', methods=['POST'])
 def update_status():
     code = request.form.get('code')
-    is_distracted = str(request.form.get('is_distracted', 'False')).lower() in ['true', '1']
-    device_registry[code] = {
-        "is_distracted": is_distracted,
-        "reason": request.form.get('reason', 'Focusing'),
-        "timestamp": request.form.get('timestamp', ''),
-        "session_id": int(request.form.get('session_id', 0)),
-        "seconds": int(request.form.get('seconds', 0)) # Timer data
-    }
-    if 'image' in request.files and is_distracted:
-        request.files['image'].save(os.path.join(PROOFS_DIR, f"proof_{code}.jpg"))
+    try:
+        values = normalize_event(request.form)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Malformed status"}), 400
+    apply_status(code, values, request.files.get('image'), clock_skew(request.form, time.time()))
     return jsonify({"status": "success"})
 
-@app.route('/status/<code>', methods=['GET'])
-def get_status(code):
-    data = device_registry.get(code, {"is_distracted": False, "reason": "Offline", "seconds": 0, "session_id": 0})
+@app.route('/update_status/batch', methods=['POST'])
+def update_status_batch():
+    """Ordered status events in one request: {"code", "events": [...]} or a bare [...] of
+    events (code per event or ?code=) as JSON, msgpack, or a multipart "events" field plus
+    one "image" for the event marked "proof": true. Nothing is applied if any event is invalid."""
+    try:
+        if request.mimetype == 'application/msgpack':
+            if msgpack is None: return jsonify({"error": "msgpack not supported"}), 415
+            batch = msgpack.unpackb(request.get_data(), raw=False)
+        elif request.mimetype == 'application/json':
+            batch = request.get_json()
+        else:
+            batch = json.loads(request.form.get('events', 'null'))
+        if isinstance(batch, list):
+            batch = {"events": batch}
+        events = batch.get('events', [])
+    except Exception as e:
+        metrics.error("status_batch_decode", e)
+        return jsonify({"error": "Malformed batch"}), 400
+    default_code = batch.get('code') or request.args.get('code')
+    if not isinstance(events, list) or not all(isinstance(e, dict) for e in events):
+        return jsonify({"error": "Events must be a list of objects"}), 400
+    if not all(e.get('code', default_code) for e in events):
+        return jsonify({"error": "Missing code"}), 400
+    try:
+        events = [normalize_event(e) for e in events]  # all or nothing: parse every event first
+    except (TypeError, ValueError):
+        return jsonify({"error": "Malformed event"}), 400
+    image = request.files.get('image')
+    skew = clock_skew(batch, time.time())
+    for event in events:
+        apply_status(event.get('code', default_code), event, image if event.get('proof') else None, skew)
+    return jsonify({"status": "success", "applied": len(events)})
+
+def is_stale(data):
+    received_at = data.get("received_at")
+    return bool(received_at) and data.get("reason") not in ("Stopped", "Offline") and \
+        time.time() - received_at > STALE_AFTER_SECS
 
+def presence(data):
+    """The room as clients should see it: Offline once its heartbeat stopped"""
+    if not is_stale(data): return data
+    return {**data, "is_distracted": False, "reason": "Offline"}
+
+def status_payload(code, data, host_url):
+    data = presence(data)
     # Determine the status string
     if data.get("reason") == "Stopped" or data.get("reason") == "Offline":
         status_str = "IDLE"
@@ -180,21 +597,137 @@ def get_status(code):
 
     response = {
         "status": status_str,
-        "seconds": data.get("seconds", 0),
+        "seconds": live_seconds(data),  # clients only report changes and a heartbeat
         "session_id": data.get("session_id"),
         "reason": data.get("reason", ""),
         "timestamp": data.get("timestamp", ""),
+        "version": data.get("version", 0),
         "image_url": None
     }
     if data.get("is_distracted"):
-        response["image_url"] = f"{request.host_url}proofs/proof_{code}.jpg"
-    return jsonify(response)
+        if data.get("proof"):
+            response["image_url"] = f"{host_url}proofs/{data['proof']}.jpg"
+            if data.get("proof_thumb"):
+                response["thumb_url"] = f"{host_url}proofs/{data['proof']}_{data['proof_thumb']}.jpg"
+        else:
+            response["image_url"] = f"{host_url}proofs/proof_{code}.jpg"
+    return response
+
+def live_seconds(data):
+    """Session timer extrapolated from the last report, for ticks between updates. Frozen
+    at the last reported value once the room went stale."""
+    if data.get("reason") in ("Stopped", "Offline") or not data.get("received_at") or is_stale(data):
+        return data.get("seconds", 0)
+    return data.get("seconds", 0) + int(time.time() - data["received_at"])
+
+@app.route('/status/<code>', methods=['GET'])
+def get_status(code):
+    """With ?since=<version>, long-polls up to ?wait= seconds for the room to change"""
+    if request.args.get('since') is not None:
+        try:
+            since, wait = parse_since(None, request.args['since']), parse_wait(request.args.get('wait'))
+        except ValueError:
+            return jsonify(BAD_STREAM_PARAMS), 400
+        if not stream_slots.acquire(blocking=False): return streams_full()
+        try:
+            registry_watcher.wait(since, wait, code)
+        finally:
+            stream_slots.release()
+    with metrics.timed("registry", "get"):
+        data = device_registry.get(code, OFFLINE_DEVICE)
+    return jsonify(status_payload(code, data, request.host_url))
+
+@app.route('/status/<code>/stream', methods=['GET'])
+def stream_status(code):
+    """SSE: a "status" event on every change of the room, a "tick" with the timer otherwise"""
+    try:
+        since = stream_since()
+    except ValueError:
+        return jsonify(BAD_STREAM_PARAMS), 400
+    host_url = request.host_url
+    def events(version):
+        stale = False
+        while True:
+            current = registry_watcher.wait(version, STREAM_TICK_SECS, code)
+            data = device_registry.get(code, OFFLINE_DEVICE)
+            was_stale, stale = stale, is_stale(data)
+            if current > version or stale != was_stale:
+                # A room going stale changes nothing in the registry: announce it here
+                version = max(current, version)
+                yield sse("status", status_payload(code, data, host_url), version)
+            else:
+                yield sse("tick", {"seconds": live_seconds(data), "version": version})
+    return sse_response(events(since))
 
 @app.route('/proofs/<filename>')
 def serve_proof_file(filename):
     """Serves the actual image file to the mobile/web app"""
+    blob = proof_store.BLOB_NAME.match(filename)
+    if blob:
+        # Content-addressed: the bytes behind this URL never change
+        path = proof_store.blob_path(blob.group(1), blob.group(2))
+        if not os.path.exists(path): return jsonify({"error": "Not found"}), 404
+        resp = send_file(path, mimetype='image/jpeg',
+                         etag=filename, max_age=31536000, conditional=True)
+        resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return resp
+    if filename.startswith('proof_') and filename.endswith('.jpg'):
+        # Legacy per-room URL: latest proof, revalidated by ETag on every poll
+        digest = proof_store.latest(filename[len('proof_'):-len('.jpg')])
+        if digest:
+            resp = send_file(proof_store.blob_path(digest), mimetype='image/jpeg', etag=digest, max_age=0, conditional=True)
+            resp.headers['Cache-Control'] = 'no-cache'
+            return resp
     return send_from_directory(PROOFS_DIR, filename)
 
+@app.route('/proofs/history/<code>')
+def get_proof_history(code):
+    """Newest first; ?session_id= narrows to one session"""
+    session_id = request.args.get('session_id', type=int)
+    items = []
+    for item in proof_store.history(code, session_id):
+        width = proof_store.thumb_width(item["hash"])
+        items.append({**item, "image_url": f"{request.host_url}proofs/{item['hash']}.jpg",
+                      "thumb_url": f"{request.host_url}proofs/{item['hash']}_{width}.jpg" if width else None})
+    return jsonify(items)
+
+# --- METRICS ---
+
+@app.before_request
+def start_request_timer():
+    metrics.begin_request()
+
+@app.after_request
+def record_request_timer(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.end_request(route, request.method, response.status_code)
+    return response
+
+def room_counts():
+    counts = {"focused": 0, "distracted": 0, "idle": 0}
+    for _, info in device_registry.items():
+        info = presence(info)
+        if info.get("reason") in ("Stopped", "Offline"): counts["idle"] += 1
+        elif info.get("is_distracted"): counts["distracted"] += 1
+        else: counts["focused"] += 1
+    return [({"state": state}, n) for state, n in counts.items()]
+
+def mail_counts():
+    st = mail_queue.stats()
+    return [({"status": k}, st[k]) for k in ("queued", "sent", "failed")]
+
+metrics.gauge("focus_registry_devices", lambda: len(device_registry), "Rooms in the device registry (within DEVICE_TTL)")
+metrics.gauge("focus_rooms", room_counts, "Rooms by current state")
+metrics.gauge("focus_license_cache_entries", lambda: len(license_cache), "License lookups cached in this process (paid keys and recent misses)")
+metrics.gauge("focus_ledger_cache_rows", lambda: len(ledger_cache["rows"]), "Transactions held by the admin ledger cache")
+metrics.gauge("focus_mail_queue", mail_counts, "Outbox messages by status")
+metrics.gauge("focus_sepay_pending_notes", sepay_index.pending_count, "Registered transaction notes without a matching transfer")
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text format; per process (see metrics.py)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
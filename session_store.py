@@ -0,0 +1,252 @@
+"""Focus session history: run-length encoded state intervals plus running aggregates.
+
+Every status report is reduced to a state (focused / distracted / stopped) and stored as
+intervals per (code, session_id): a report in the same state as the open interval only
+moves that interval's end, so a session is a handful of rows however often the client
+reports. The same write updates the session's and the UTC day's totals, so dashboard
+reads never scan intervals.
+
+Times are when the client says the event happened (its ts, corrected for clock skew by
+server.event_time), clamped between the session's last event and the arrival, so a
+batch or an offline replay keeps its real spacing. Clients re-send their state every
+HEARTBEAT_SECS; past GAP_SECS of silence (three missed heartbeats, the same threshold the
+server uses to show a room Offline) a session stops being live and the silence is not
+credited to any state (the client crashed or went offline).
+
+A compactor thread (one per host, elected with a lock file like the SePay poller) closes
+sessions that went silent, folds short detection flickers out of finished sessions'
+timelines and drops intervals past RETENTION_DAYS; the aggregates are kept.
+"""
+import os
+import time
+
+import metrics
+import local_db
+
+HEARTBEAT_SECS = 60  # Src/status_client.py
+GAP_SECS = int(os.getenv("STALE_AFTER_SECS", 3 * HEARTBEAT_SECS))
+RETENTION_DAYS = 90
+COMPACT_INTERVAL = 600
+COARSEN_AFTER_SECS = 86400
+FLICKER_SECS = 5
+STATES = ("focused", "distracted")
+
+_compactor = {"pid": None}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intervals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT, session_id INTEGER, state TEXT,
+    start REAL, end REAL, events INTEGER);
+CREATE INDEX IF NOT EXISTS intervals_session ON intervals (code, session_id, start);
+CREATE INDEX IF NOT EXISTS intervals_end ON intervals (end);
+CREATE TABLE IF NOT EXISTS sessions (
+    code TEXT, session_id INTEGER, started REAL, last_seen REAL, state TEXT, open_interval INTEGER,
+    focused_secs REAL DEFAULT 0, distracted_secs REAL DEFAULT 0, distractions INTEGER DEFAULT 0,
+    events INTEGER DEFAULT 0, compacted INTEGER DEFAULT 0, PRIMARY KEY (code, session_id));
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (state, last_seen);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT, code TEXT, focused_secs REAL DEFAULT 0, distracted_secs REAL DEFAULT 0,
+    distractions INTEGER DEFAULT 0, sessions INTEGER DEFAULT 0, PRIMARY KEY (day, code));
+"""
+
+_db = local_db.connector("sessions.db", SCHEMA, autocommit=True)
+
+def state_of(is_distracted, reason):
+    if reason in ("Stopped", "Offline"): return "stopped"
+    return "distracted" if is_distracted else "focused"
+
+def day_of(ts):
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+def _split_days(start, end):
+    """[start, end) cut at UTC midnights: yields (day, seconds)"""
+    while start < end:
+        midnight = (int(start // 86400) + 1) * 86400
+        cut = min(end, midnight)
+        yield day_of(start), cut - start
+        start = cut
+
+def _credit(conn, code, state, start, end):
+    """Adds [start, end) in state to the session's day totals"""
+    if state not in STATES or end <= start: return
+    for day, secs in _split_days(start, end):
+        conn.execute(f"INSERT INTO daily (day, code, {state}_secs) VALUES (?, ?, ?) "
+                     f"ON CONFLICT (day, code) DO UPDATE SET {state}_secs = {state}_secs + excluded.{state}_secs",
+                     (day, code, secs))
+
+def _close(conn, code, session_id, row, until):
+    """Ends the open interval of a session at until (credited if within GAP_SECS)"""
+    state, last_seen, open_interval = row
+    end = min(until, last_seen + GAP_SECS)
+    if state in STATES and end > last_seen:
+        conn.execute(f"UPDATE sessions SET {state}_secs = {state}_secs + ? WHERE code = ? AND session_id = ?",
+                     (end - last_seen, code, session_id))
+        _credit(conn, code, state, last_seen, end)
+    if open_interval is not None:
+        conn.execute("UPDATE intervals SET end = max(end, ?) WHERE id = ?", (end, open_interval))
+
+def record(code, session_id, is_distracted, reason, ts=None):
+    """Applies one status report. A "Stopped" report without a session id (the desktop
+    client sends 0) ends the room's most recent open session."""
+    if not code: return
+    ts = ts or time.time()
+    state = state_of(is_distracted, reason)
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not session_id and state == "stopped":
+            found = conn.execute("SELECT session_id FROM sessions WHERE code = ? AND state != 'stopped' "
+                                 "ORDER BY last_seen DESC LIMIT 1", (code,)).fetchone()
+            if found is None:
+                conn.execute("COMMIT")
+                return
+            session_id = found[0]
+        row = conn.execute("SELECT state, last_seen, open_interval FROM sessions WHERE code = ? AND session_id = ?",
+                           (code, session_id)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO sessions (code, session_id, started, last_seen, state) VALUES (?, ?, ?, ?, 'stopped')",
+                         (code, session_id, ts, ts))
+            conn.execute("INSERT INTO daily (day, code, sessions) VALUES (?, ?, 1) "
+                         "ON CONFLICT (day, code) DO UPDATE SET sessions = sessions + 1", (day_of(ts), code))
+            row = ("stopped", ts, None)
+        prev_state, last_seen, open_interval = row
+        ts = max(ts, last_seen)  # out-of-order or skewed events never move time backwards
+        fresh = ts - last_seen <= GAP_SECS
+
+        if state == prev_state and fresh and open_interval is not None:
+            # Same state: run-length, just extend the open interval
+            if state in STATES:
+                conn.execute(f"UPDATE sessions SET {state}_secs = {state}_secs + ? WHERE code = ? AND session_id = ?",
+                             (ts - last_seen, code, session_id))
+                _credit(conn, code, state, last_seen, ts)
+            conn.execute("UPDATE intervals SET end = ?, events = events + 1 WHERE id = ?", (ts, open_interval))
+        else:
+            _close(conn, code, session_id, row, ts)
+            open_interval = None
+            if state != "stopped":
+                open_interval = conn.execute("INSERT INTO intervals (code, session_id, state, start, end, events) "
+                                             "VALUES (?, ?, ?, ?, ?, 1)", (code, session_id, state, ts, ts)).lastrowid
+            if state == "distracted" and prev_state != "distracted":
+                conn.execute("UPDATE sessions SET distractions = distractions + 1 WHERE code = ? AND session_id = ?", (code, session_id))
+                conn.execute("INSERT INTO daily (day, code, distractions) VALUES (?, ?, 1) "
+                             "ON CONFLICT (day, code) DO UPDATE SET distractions = distractions + 1", (day_of(ts), code))
+        conn.execute("UPDATE sessions SET last_seen = ?, state = ?, open_interval = ?, events = events + 1, compacted = 0 "
+                     "WHERE code = ? AND session_id = ?", (ts, state, open_interval, code, session_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+# --- QUERIES ---
+
+def _session_dict(row, now):
+    code, session_id, started, last_seen, state, focused, distracted, distractions, events = row
+    live = state in STATES and now - last_seen <= GAP_SECS
+    if live:  # the open interval runs until now
+        if state == "focused": focused += now - last_seen
+        else: distracted += now - last_seen
+    total = focused + distracted
+    return {
+        "code": code, "session_id": session_id, "started": started, "last_seen": last_seen,
+        "state": state, "live": live, "focused_secs": round(focused, 1), "distracted_secs": round(distracted, 1),
+        "distractions": distractions, "events": events,
+        "focus_rate": round(focused / total, 4) if total else None,
+    }
+
+SESSION_COLUMNS = "code, session_id, started, last_seen, state, focused_secs, distracted_secs, distractions, events"
+
+def sessions(code, limit=50):
+    """The room's sessions, newest first"""
+    now = time.time()
+    rows = _db().execute(f"SELECT {SESSION_COLUMNS} FROM sessions WHERE code = ? ORDER BY started DESC LIMIT ?",
+                         (code, limit)).fetchall()
+    return [_session_dict(r, now) for r in rows]
+
+def session(code, session_id):
+    """One session's totals and its interval timeline, or None"""
+    conn = _db()
+    row = conn.execute(f"SELECT {SESSION_COLUMNS} FROM sessions WHERE code = ? AND session_id = ?", (code, session_id)).fetchone()
+    if row is None: return None
+    result = _session_dict(row, time.time())
+    result["intervals"] = [{"state": s, "start": a, "end": b, "events": n} for s, a, b, n in conn.execute(
+        "SELECT state, start, end, events FROM intervals WHERE code = ? AND session_id = ? ORDER BY start", (code, session_id))]
+    return result
+
+def daily(code=None, date_from=None, date_to=None):
+    """Per-day totals (UTC days), for one room or summed over all rooms"""
+    where, args = ["1"], []
+    if code: where, args = where + ["code = ?"], args + [code]
+    if date_from: where, args = where + ["day >= ?"], args + [date_from]
+    if date_to: where, args = where + ["day <= ?"], args + [date_to]
+    rows = _db().execute("SELECT day, sum(focused_secs), sum(distracted_secs), sum(distractions), sum(sessions) "
+                         f"FROM daily WHERE {' AND '.join(where)} GROUP BY day ORDER BY day", args).fetchall()
+    result = []
+    for day, focused, distracted, distractions, count in rows:
+        total = focused + distracted
+        result.append({"day": day, "focused_secs": round(focused, 1), "distracted_secs": round(distracted, 1),
+                       "distractions": distractions, "sessions": count,
+                       "focus_rate": round(focused / total, 4) if total else None})
+    return result
+
+# --- COMPACTION ---
+
+def _fold_flickers(conn, code, session_id):
+    """A blip shorter than FLICKER_SECS between two contiguous intervals of the same state
+    becomes part of one interval. Session and day totals are already counted, so only the
+    timeline loses detail."""
+    rows = [list(r) for r in conn.execute("SELECT id, state, start, end, events FROM intervals "
+                                          "WHERE code = ? AND session_id = ? ORDER BY start", (code, session_id))]
+    folded, i = 0, 1
+    while i + 1 < len(rows):
+        a, blip, b = rows[i - 1], rows[i], rows[i + 1]
+        if a[1] == b[1] != blip[1] and blip[3] - blip[2] < FLICKER_SECS and a[3] == blip[2] and blip[3] == b[2]:
+            a[3], a[4] = b[3], a[4] + blip[4] + b[4]
+            conn.execute("UPDATE intervals SET end = ?, events = ? WHERE id = ?", (a[3], a[4], a[0]))
+            conn.execute("DELETE FROM intervals WHERE id IN (?, ?)", (blip[0], b[0]))
+            del rows[i:i + 2]
+            folded += 2
+        else:
+            i += 1
+    return folded
+
+def compact(now=None):
+    """Closes silent sessions, folds flickers in sessions that ended more than
+    COARSEN_AFTER_SECS ago and drops intervals older than RETENTION_DAYS.
+    Returns the counts of each."""
+    now = now or time.time()
+    conn = _db()
+    stats = {"closed": 0, "folded": 0, "expired": 0}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        stale = conn.execute("SELECT code, session_id, state, last_seen, open_interval FROM sessions "
+                             "WHERE state != 'stopped' AND last_seen < ?", (now - GAP_SECS,)).fetchall()
+        for code, session_id, state, last_seen, open_interval in stale:
+            _close(conn, code, session_id, (state, last_seen, open_interval), now)
+            conn.execute("UPDATE sessions SET state = 'stopped', open_interval = NULL WHERE code = ? AND session_id = ?", (code, session_id))
+        stats["closed"] = len(stale)
+
+        done = conn.execute("SELECT code, session_id FROM sessions WHERE state = 'stopped' AND compacted = 0 "
+                            "AND last_seen < ?", (now - COARSEN_AFTER_SECS,)).fetchall()
+        for code, session_id in done:
+            stats["folded"] += _fold_flickers(conn, code, session_id)
+            conn.execute("UPDATE sessions SET compacted = 1 WHERE code = ? AND session_id = ?", (code, session_id))
+
+        stats["expired"] = conn.execute("DELETE FROM intervals WHERE end < ?", (now - RETENTION_DAYS * 86400,)).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return stats
+
+def _compact_loop():
+    while True:
+        time.sleep(COMPACT_INTERVAL)
+        try:
+            compact()
+        except Exception as e:
+            print(f"Session compactor error: {e}")
+            metrics.error("session_compactor", e)
+
+def start_compactor():
+    """Starts the compactor thread in this process once"""
+    local_db.start_leader(_compactor, "session_compactor.lock", COMPACT_INTERVAL, _compact_loop)
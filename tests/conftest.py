@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest # type: ignore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "Src"), os.path.join(ROOT, "benchmarks")):
+    if path not in sys.path: sys.path.insert(0, path)
+# Before any test module imports a store: all local state goes to a temp dir
+DATA_DIR = os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="focus-test-")
+
+@pytest.fixture(scope="session")
+def server():
+    """server.py on the in-memory Firebase fake (benchmarks/fakes.py), state in a temp dir"""
+    from bench_server import load_server
+    return load_server(DATA_DIR)
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
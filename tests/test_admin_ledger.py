@@ -0,0 +1,12 @@
+def test_bad_limit_is_400(client):
+    for limit in ("abc", "-1", "1.5"):
+        resp = client.get(f'/admin/ledger?limit={limit}')
+        assert resp.status_code == 400 and "limit" in resp.get_json()["error"]
+
+def test_limit_pages_the_ledger(client):
+    for i in range(3):
+        note = client.get('/generate_transaction_note?plan=PRO').get_json()['transaction_note']
+        client.post('/confirm_transaction', json={"transaction_note": note, "email": f"l{i}@example.com"})
+    resp = client.get('/admin/ledger?limit=2')
+    assert resp.status_code == 200 and len(resp.get_json()) == 2 and resp.headers['X-Next-Cursor']
+    assert client.get('/admin/ledger?limit=0').status_code == 200
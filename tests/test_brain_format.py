@@ -0,0 +1,29 @@
+import os
+import weakref
+
+import numpy as np # type: ignore
+
+import brain_format
+from crystal_graph import VertexStore, EdgeStore
+
+def test_saving_a_loaded_brain_releases_its_mappings(tmp_path):
+    path = str(tmp_path / "crystal_brain.pb")
+    vertices = VertexStore()
+    edges = EdgeStore(vertices)
+    ids, _ = vertices.intern_many(["a", "b", "c", "a"])
+    edges.add_bigrams(ids, 0.1)
+    brain_format.save_brain(path, vertices, edges, {"focus": np.ones(3)})
+
+    vertices, edges, domains = brain_format.load_brain(path)
+    mapped = [vertices.coords, edges.src, edges.dst, edges.weights, vertices.tokens.offsets, vertices.tokens.data]
+    assert all(isinstance(a, np.memmap) for a in mapped)
+    refs = [weakref.ref(a) for a in mapped]
+    del mapped
+    vertices["d"] = (1, 2, 3)
+    brain_format.save_brain(path, vertices, edges, domains)  # same file, as process_training does
+    assert all(r() is None for r in refs)  # no open mapping left (Windows would refuse the replace)
+
+    vertices, edges, domains = brain_format.load_brain(path)
+    assert list(vertices.tokens) == ["a", "b", "c", "d"] and list(vertices["d"]) == [1, 2, 3]
+    assert np.isclose(edges["a<->b"], 0.1) and list(domains) == ["focus"]
+    assert not [f for f in os.listdir(tmp_path) if ".tmp-" in f]
@@ -0,0 +1,33 @@
+import numpy as np # type: ignore
+
+from crystal_graph import VertexStore, EdgeStore
+
+def test_vertex_store_keeps_rows_when_growing():
+    store = VertexStore(capacity=4)
+    for i in range(10):
+        store[f"w{i}"] = (i, i, i)
+    ids, first = store.intern_many([f"w{i}" for i in range(8, 40)])
+    assert first.sum() == 30 and len(store) == 40 and len(store.coords) >= 40
+    assert [int(store[f"w{i}"][0]) for i in range(10)] == list(range(10))
+    assert not store["w39"].any()  # new tokens start at the origin
+
+def test_edge_store_add_bigrams_past_capacity():
+    vertices = VertexStore(capacity=2)
+    edges = EdgeStore(vertices, capacity=2)
+    words = [f"w{i}" for i in range(50)]
+    expected = {}
+    for _ in range(3):
+        ids, _ = vertices.intern_many(words)
+        edges.add_bigrams(ids, 0.1)
+        for w1, w2 in zip(words, words[1:]):
+            key = f"{w1}<->{w2}" if w1 < w2 else f"{w2}<->{w1}"
+            expected[key] = expected.get(key, 0) + 0.1
+    assert len(edges) == 49 and len(edges.weights) >= 49
+    assert set(edges.keys()) == set(expected)
+    assert all(np.isclose(edges[k], v) for k, v in expected.items())
+
+def test_edge_store_setitem_past_capacity():
+    edges = EdgeStore(VertexStore(capacity=2), capacity=2)
+    for i in range(20):
+        edges[f"a{i}<->b{i}"] = i
+    assert [edges[f"a{i}<->b{i}"] for i in range(20)] == list(range(20))
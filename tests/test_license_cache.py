@@ -0,0 +1,23 @@
+def test_unknown_key_is_cached_briefly(server, client, monkeypatch):
+    calls = []
+    reference = server.db.reference
+    monkeypatch.setattr(server.db, "reference", lambda path="/": calls.append(path) or reference(path))
+    for _ in range(3):
+        assert client.post('/verify_license', json={"license_key": "NOPE-0000"}).status_code == 404
+    assert calls == ['licenses/NOPE-0000', 'transactions']
+
+def test_fallback_can_be_disabled(server, monkeypatch):
+    monkeypatch.setattr(server, "LICENSE_TX_FALLBACK", False)
+    calls = []
+    reference = server.db.reference
+    monkeypatch.setattr(server.db, "reference", lambda path="/": calls.append(path) or reference(path))
+    assert server.lookup_license("NOPE-0001") is None
+    assert calls == ['licenses/NOPE-0001']
+
+def test_settled_key_replaces_cached_miss(server, client):
+    note = client.get('/generate_transaction_note?plan=PRO').get_json()['transaction_note']
+    client.post('/confirm_transaction', json={"transaction_note": note, "email": "buyer@example.com"})
+    key = server.db.reference(f'transactions/{note}/license_key').get()
+    assert server.lookup_license(key) is None
+    server.settle_payment(note, 315000)
+    assert server.lookup_license(key)["status"] == "paid"
@@ -0,0 +1,10 @@
+def test_forged_forwarded_for_does_not_reset_the_ip_bucket(server, client, monkeypatch):
+    monkeypatch.setattr(server.payment_ip_limit, "rate", 0.001)
+    monkeypatch.setattr(server.payment_ip_limit, "burst", 2)
+    statuses = []
+    for i in range(4):
+        # The proxy appends the real peer (203.0.113.7); the first hop is client-controlled
+        headers = {"X-Forwarded-For": f"10.0.0.{i}, 203.0.113.7"}
+        resp = client.post('/check_payment_status', json={"transaction_note": f"GF{i}"}, headers=headers)
+        statuses.append(resp.status_code)
+    assert statuses[:2] != [429, 429] and statuses[2:] == [429, 429]
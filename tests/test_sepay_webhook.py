@@ -0,0 +1,30 @@
+import itertools
+
+transfer_ids = itertools.count(1)
+
+def pending_note(client):
+    note = client.get('/generate_transaction_note?plan=PRO').get_json()['transaction_note']
+    client.post('/confirm_transaction', json={"transaction_note": note, "email": "buyer@example.com"})
+    return note
+
+def transfer(note):
+    ref = next(transfer_ids)
+    return {"id": ref, "transferType": "in", "content": f"CT DEN {note} FT{ref:08d}", "transferAmount": 315000}
+
+def assert_unpaid(client, note):
+    assert client.post('/check_payment_status', json={"transaction_note": note}).get_json()["status"] == "not_found_yet"
+
+def test_webhook_refused_without_configured_key(server, client, monkeypatch):
+    monkeypatch.setattr(server, "SEPAY_WEBHOOK_KEY", None)
+    note = pending_note(client)
+    assert client.post('/sepay/webhook', json=transfer(note)).status_code == 503
+    assert_unpaid(client, note)
+
+def test_webhook_requires_the_key(server, client, monkeypatch):
+    monkeypatch.setattr(server, "SEPAY_WEBHOOK_KEY", "secret")
+    note = pending_note(client)
+    for headers in ({}, {"Authorization": "Apikey wrong"}, {"Authorization": "secret"}):
+        assert client.post('/sepay/webhook', json=transfer(note), headers=headers).status_code == 401
+    assert_unpaid(client, note)
+    assert client.post('/sepay/webhook', json=transfer(note), headers={"Authorization": "Apikey secret"}).status_code == 200
+    assert client.post('/check_payment_status', json={"transaction_note": note}).get_json()["status"] == "success"
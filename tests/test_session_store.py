@@ -0,0 +1,40 @@
+import time
+
+import session_store
+
+def test_batched_replay_keeps_event_spacing(server, client):
+    now = time.time()
+    sent_at = now + 3600  # client clock one hour ahead of the server
+    events = [{"is_distracted": False, "session_id": 5, "reason": "Focusing", "ts": sent_at - 400},
+              {"is_distracted": True, "session_id": 5, "reason": "Phone", "ts": sent_at - 280},
+              {"is_distracted": False, "session_id": 5, "reason": "Focusing", "ts": sent_at - 130}]
+    resp = client.post('/update_status/batch', json={"code": "HIST1", "events": events, "sent_at": sent_at})
+    assert resp.status_code == 200
+    session = session_store.session("HIST1", 5)
+    spans = [(i["state"], round(i["end"] - i["start"])) for i in session["intervals"]]
+    assert spans == [("focused", 120), ("distracted", 150), ("focused", 0)]
+    assert abs(session["intervals"][0]["start"] - (now - 400)) < 5
+    assert session["distractions"] == 1
+
+def test_event_times_are_clamped_to_arrival(server):
+    received = time.time()
+    assert server.event_time({"ts": received + 50}, received) == received
+    assert server.event_time({"ts": "junk"}, received) == received
+    assert server.event_time({}, received) == received
+    assert server.event_time({"ts": received - 10}, received, skew=4) == received - 6
+
+def test_events_never_move_a_session_backwards():
+    t0 = 1_000_000.0
+    session_store.record("HIST2", 1, False, "Focusing", t0)
+    session_store.record("HIST2", 1, True, "Phone", t0 + 60)
+    session_store.record("HIST2", 1, False, "Focusing", t0 + 30)  # older than the last event
+    intervals = session_store.session("HIST2", 1)["intervals"]
+    assert [(i["state"], i["start"] - t0) for i in intervals] == [("focused", 0), ("distracted", 60), ("focused", 60)]
+
+def test_compact_credits_a_silent_session_one_gap_at_most():
+    t0 = 2_000_000.0
+    session_store.record("HIST9", 1, False, "Focusing", t0)
+    session_store.record("HIST9", 1, False, "Focusing", t0 + 60)  # then the client vanishes
+    session_store.compact(now=t0 + 3600)
+    session = session_store.session("HIST9", 1)
+    assert session["state"] == "stopped" and session["focused_secs"] == 60 + 3 * 60  # last report plus one gap
@@ -0,0 +1,22 @@
+def test_bare_list_takes_code_from_query(server, client):
+    events = [{"is_distracted": "False", "session_id": 1, "reason": "Focusing"},
+              {"is_distracted": "True", "session_id": 1, "reason": "Phone"}]
+    resp = client.post('/update_status/batch?code=BATCH1', json=events)
+    assert resp.status_code == 200 and resp.get_json()["applied"] == 2
+    assert client.get('/status/BATCH1').get_json()["status"] == "DISTRACTED"
+
+def test_bare_list_code_per_event(client):
+    resp = client.post('/update_status/batch', json=[{"code": "BATCH2", "is_distracted": "True", "reason": "Phone"}])
+    assert resp.status_code == 200
+    assert client.get('/status/BATCH2').get_json()["status"] == "DISTRACTED"
+
+def test_invalid_batches_are_400(client):
+    for body in ({"code": "BATCH3", "events": ["x"]}, {"code": "BATCH3", "events": "x"}, ["x"], 5,
+                 [{"is_distracted": "True"}],
+                 [{"code": "BATCH3", "is_distracted": "True", "session_id": 1},
+                  {"code": "BATCH3", "session_id": "x"}],
+                 {"code": "BATCH3", "events": [{"is_distracted": "True"}, {"seconds": "1.5"}]},
+                 {"code": "BATCH3", "events": [{"is_distracted": "True"}, {"ts": "soon"}]},
+                 {"code": "BATCH3", "events": [{"is_distracted": "True"}, {"session_id": None}]}):
+        assert client.post('/update_status/batch', json=body).status_code == 400, body
+    assert client.get('/status/BATCH3').get_json()["status"] == "IDLE"
@@ -0,0 +1,35 @@
+import time
+
+from status_client import StatusReporter
+
+class FakeSession:
+    """requests.Session stand-in that posts to the Flask test client"""
+    def __init__(self, client):
+        self.client = client
+    def post(self, url, json=None, data=None, files=None, timeout=None):
+        path = url.split("/", 3)[3]
+        if json is not None: r = self.client.post("/" + path, json=json)
+        else: r = self.client.post("/" + path, data=data)
+        r.ok, r.text = r.status_code < 400, r.get_data(as_text=True)
+        return r
+
+def test_rejected_event_is_dropped_not_retried(client):
+    reporter = StatusReporter("http://test", "CLIENT1", flush_delay=0)
+    reporter.session = FakeSession(client)
+    reporter.push({"is_distracted": True, "session_id": 1, "reason": "Phone", "seconds": 5})
+    reporter.push({"is_distracted": False, "session_id": "x", "reason": "Focusing", "seconds": 6})
+    reporter.close()
+    assert not reporter.thread.is_alive() and not reporter.events
+    assert reporter.stats()["events_rejected"] == 1
+    assert client.get('/status/CLIENT1').get_json()["status"] == "DISTRACTED"
+
+def test_idle_sender_sleeps_until_pushed(client, monkeypatch):
+    reporter = StatusReporter("http://test", "CLIENT2", flush_delay=0)
+    reporter.session = FakeSession(client)
+    calls = []
+    heartbeat = reporter._heartbeat
+    monkeypatch.setattr(reporter, "_heartbeat", lambda: calls.append(1) or heartbeat())
+    time.sleep(0.5)
+    assert not calls  # nothing reported yet: parked without a timeout, not polling
+    reporter.close()
+    assert not reporter.thread.is_alive()
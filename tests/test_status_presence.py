@@ -0,0 +1,61 @@
+import time
+
+def report(client, code, distracted="False", reason="Focusing", seconds=100):
+    client.post('/update_status', data={"code": code, "is_distracted": distracted, "session_id": "1",
+                                        "reason": reason, "seconds": str(seconds)})
+
+def age(server, code, secs):
+    data = server.device_registry.get(code)
+    server.device_registry.update(code, {"received_at": data["received_at"] - secs})
+
+def test_live_room_extrapolates_the_timer(server, client):
+    report(client, "PRES1")
+    age(server, "PRES1", 30)
+    body = client.get('/status/PRES1').get_json()
+    assert body["status"] == "FOCUSING" and 129 <= body["seconds"] <= 131
+
+def test_silent_room_goes_offline_with_a_frozen_timer(server, client):
+    report(client, "PRES2", distracted="True", reason="Phone")
+    age(server, "PRES2", server.STALE_AFTER_SECS + 1)
+    body = client.get('/status/PRES2').get_json()
+    assert body["status"] == "IDLE" and body["reason"] == "Offline" and body["seconds"] == 100
+    assert body["image_url"] is None
+    assert server.live_seconds(server.device_registry.get("PRES2")) == 100
+
+def test_stream_announces_a_room_going_stale(server, client, monkeypatch):
+    monkeypatch.setattr(server, "STREAM_TICK_SECS", 0.05)
+    report(client, "PRES3")
+    version = client.get('/status/PRES3').get_json()["version"]
+    stream = client.get(f'/status/PRES3/stream?since={version}', buffered=False)
+    chunks = iter(stream.response)
+    assert next(chunks).decode().startswith("event: tick")
+    monkeypatch.setattr(server, "STALE_AFTER_SECS", 0)  # goes stale without a registry write
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        chunk = next(chunks).decode()
+        if "event: status" in chunk: break
+    assert '"status": "IDLE"' in chunk and '"reason": "Offline"' in chunk and f"id: {version}" in chunk
+    stream.close()
+
+def test_live_rooms_show_a_silent_room_offline(server, client):
+    report(client, "PRES4", distracted="True", reason="Phone")
+    rooms = {room["code"]: room for room in server.live_rooms()}
+    assert rooms["PRES4"]["status"] == "Distracted" and rooms["PRES4"]["is_danger"]
+    age(server, "PRES4", server.STALE_AFTER_SECS + 1)
+    room = next(room for room in client.get('/admin/live-rooms').get_json() if room["code"] == "PRES4")
+    assert room["status"] == "Offline" and not room["is_danger"]
+
+def test_rooms_stream_announces_a_room_going_stale(server, client, monkeypatch):
+    monkeypatch.setattr(server, "STREAM_TICK_SECS", 0.05)
+    report(client, "PRES5")
+    version = client.get('/status/PRES5').get_json()["version"]
+    stream = client.get(f'/admin/live-rooms/stream?since={version}', buffered=False)
+    chunks = iter(stream.response)
+    next(chunks)  # rooms already offline from earlier tests, or a keep-alive
+    monkeypatch.setattr(server, "STALE_AFTER_SECS", 0)  # goes stale without a registry write
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        chunk = next(chunks).decode()
+        if "event: rooms" in chunk: break
+    assert '{"code": "PRES5", "status": "Offline", "is_danger": false}' in chunk and f"id: {version}" in chunk
+    stream.close()
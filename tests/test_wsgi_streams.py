@@ -0,0 +1,21 @@
+import threading
+
+def test_streams_beyond_the_cap_get_503(server, client, monkeypatch):
+    monkeypatch.setattr(server, "stream_slots", threading.BoundedSemaphore(1))
+    stream = client.get('/status/ROOM1/stream', buffered=False)
+    assert stream.status_code == 200
+    busy = client.get('/status/ROOM1?since=0&wait=0')
+    assert busy.status_code == 503 and busy.headers['Retry-After'] == str(server.STREAM_RETRY_SECS)
+    assert client.get('/admin/live-rooms/stream').status_code == 503
+    assert client.get('/status/ROOM1').status_code == 200  # plain reads never wait
+    stream.close()
+    assert client.get('/status/ROOM1?since=0&wait=0').status_code == 200
+
+def test_bad_stream_parameters_are_400(client):
+    for url, headers in (('/status/P1?since=abc', {}), ('/status/P1?since=1&wait=soon', {}),
+                         ('/status/P1?since=1&wait=nan', {}), ('/status/P1/stream?since=x', {}),
+                         ('/status/P1/stream', {"Last-Event-ID": "junk"}),
+                         ('/admin/live-rooms/stream', {"Last-Event-ID": "junk"})):
+        assert client.get(url, headers=headers).status_code == 400, url
+    # Routes that never read them do not care
+    assert client.get('/status/P1', headers={"Last-Event-ID": "junk"}).status_code == 200
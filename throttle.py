@@ -0,0 +1,65 @@
+"""Request shaping for endpoints that clients poll in a loop.
+
+TokenBuckets   per-key rate limits (per IP, per transaction note, ...); take() says how
+               long to wait when the key is out of tokens, for a Retry-After header
+SingleFlight   concurrent callers asking for the same key share one execution and its result
+
+Both are per process, like the license and ledger caches in server.py.
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+
+class TokenBuckets:
+    """rate tokens per second, up to burst, per key. The least recently used keys are
+    dropped past max_keys (a dropped key simply starts again with a full bucket)."""
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate, self.burst, self.max_keys = rate, burst, max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Spends one token; returns 0 if allowed, else the whole seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed: tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else max(1, math.ceil((1 - tokens) / self.rate))
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.error = None
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """fn() once per key at a time; callers arriving meanwhile get the same result
+        (or exception). Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader: call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None: raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()